@@ -0,0 +1,221 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import engine
+
+
+def position_from_squares(red, black, kings=(), turn=True):
+    """Makes a Position (with red at the top) from lists of square indexes"""
+    red_mask = sum(1 << square for square in red)
+    black_mask = sum(1 << square for square in black)
+    kings_mask = sum(1 << square for square in kings)
+    return engine.Position(red_mask, black_mask, kings_mask, turn, True)
+
+
+# The fixed positions everything is measured on, black (at the bottom) to move in all of them
+POSITIONS = {
+    "opening": engine.new_game(),
+    "middlegame": engine.Position(red=0xc47e, black=0xf9602000),
+    # Black has to capture, either one piece or two in a row
+    "multi_jump": engine.Position(red=0x4020d4, black=0x3e001200),
+    "king_endgame": position_from_squares(red=[0, 5, 10], black=[20, 27, 30], kings=[0, 5, 20, 27, 30]),
+}
+
+# Searches don't look anything up in the tablebases (a Tablebase of a folder that doesn't exist is empty), otherwise
+# the endgame positions would be measured differently depending on whether the files have been generated
+NO_TABLEBASE = engine.Tablebase(os.devnull)
+
+# How long each operation is repeated for to time it
+OPERATION_TIME = 0.2
+# Fewest times each fixed depth search is repeated, the fastest run counts, since anything else running on the
+# machine only ever makes a run slower
+SEARCH_RUNS = 3
+
+# Metrics where a bigger number is better, the rest are times where a smaller number is better
+HIGHER_IS_BETTER = ("per_second",)
+
+
+def time_operation(operation):
+    """Runs operation() over and over for about OPERATION_TIME seconds, returns how many times it ran per second"""
+    runs = 0
+    start = time.perf_counter()
+    elapsed = 0
+    while elapsed < OPERATION_TIME:
+        for _ in range(10):
+            operation()
+        runs += 10
+        elapsed = time.perf_counter() - start
+    return runs / elapsed
+
+
+def benchmark_operations(position):
+    """Times the building blocks of the search on a position, returns {name: calls per second}"""
+    turn = position.turn
+    player_color = position.player_color
+    moves = engine.find_moves(position, turn, player_color)
+    squares = [square for square in range(32) if position.color_at(square) is turn]
+
+    def search_all_squares():
+        for square in squares:
+            engine.search(square, position, player_color)
+
+    def make_unmake():
+        undo = engine.move_piece(position, moves[0], player_color)
+        engine.unmake_move(position, undo)
+
+    # Made once, since making a table is much slower than a shallow search, and emptied before each search so it
+    # doesn't just find the answer from the last one
+    table = engine.TranspositionTable(1)
+    empty = bytes(len(table.buffer))
+
+    def minimax_depth_2():
+        table.buffer[:] = empty
+        engine.minimax(position, turn, 0, 2, player_color, engine.SearchState(table, tablebase=NO_TABLEBASE))
+
+    return {
+        "find_moves_per_second": time_operation(lambda: engine.find_moves(position, turn, player_color)),
+        "search_per_second": time_operation(search_all_squares),
+        "copy_per_second": time_operation(position.copy),
+        "move_piece_per_second": time_operation(make_unmake),
+        "evaluate_per_second": time_operation(lambda: engine.evaluate(position, player_color)),
+        "minimax_depth_2_per_second": time_operation(minimax_depth_2),
+    }
+
+
+def benchmark_perft(position, max_depth):
+    """Perft counts for depths 1 to max_depth, and how fast the deepest one was generated"""
+    counts = {}
+    for depth in range(1, max_depth + 1):
+        start = time.perf_counter()
+        counts[str(depth)] = engine.perft(position, depth)
+        elapsed = time.perf_counter() - start
+    return counts, counts[str(max_depth)] / elapsed
+
+
+def benchmark_search(position, max_depth):
+    """Fixed depth searches with an empty transposition table each time, each one repeated at least SEARCH_RUNS
+    times and for at least OPERATION_TIME seconds
+    Returns the fastest time taken to finish each depth, and the nodes per second of the deepest search
+    """
+    # Emptied rather than made again before each search, so the search doesn't pay for the memory being handed out
+    table = engine.TranspositionTable(16)
+    empty = bytes(len(table.buffer))
+    time_to_depth = {}
+    for depth in range(1, max_depth + 1):
+        runs = 0
+        total = 0
+        elapsed = None
+        while runs < SEARCH_RUNS or total < OPERATION_TIME:
+            table.buffer[:] = empty
+            start = time.perf_counter()
+            completed_depth, _, _, nodes, _ = engine.search_root(position, 0, None, depth, table,
+                                                                 tablebase=NO_TABLEBASE)
+            run_time = time.perf_counter() - start
+            runs += 1
+            total += run_time
+            if elapsed is None or run_time < elapsed:
+                elapsed = run_time
+        time_to_depth[str(depth)] = elapsed
+        if completed_depth < depth:
+            # Only one possible move, so the search stops early
+            break
+    return time_to_depth, {"depth": depth, "nodes": nodes, "time": elapsed, "nodes_per_second": nodes / elapsed}
+
+
+def run(perft_depth, search_depth):
+    results = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "perft_depth": perft_depth,
+        "search_depth": search_depth,
+        "positions": {},
+    }
+    for name, position in POSITIONS.items():
+        print(f"benchmarking {name}...", file=sys.stderr)
+        perft_counts, perft_per_second = benchmark_perft(position, perft_depth)
+        time_to_depth, search = benchmark_search(position, search_depth)
+        results["positions"][name] = {
+            "perft": perft_counts,
+            "perft_leaves_per_second": perft_per_second,
+            "operations": benchmark_operations(position),
+            "search": search,
+            "time_to_depth": time_to_depth,
+        }
+    return results
+
+
+def compare(old, new, threshold):
+    """Compares two benchmark results, returns a list of problems found
+    A timing is a regression if it got worse by more than threshold (a fraction), different perft counts mean
+    the move generator changed
+    """
+    problems = []
+    for name, new_position in new["positions"].items():
+        old_position = old["positions"].get(name)
+        if old_position is None:
+            continue
+        for depth, count in new_position["perft"].items():
+            old_count = old_position["perft"].get(depth)
+            if old_count is not None and old_count != count:
+                problems.append(f"{name}: perft({depth}) changed from {old_count} to {count}")
+
+        metrics = [("perft_leaves_per_second", old_position["perft_leaves_per_second"],
+                    new_position["perft_leaves_per_second"]),
+                   ("search nodes_per_second", old_position["search"]["nodes_per_second"],
+                    new_position["search"]["nodes_per_second"])]
+        for operation, value in new_position["operations"].items():
+            if operation in old_position["operations"]:
+                metrics.append((operation, old_position["operations"][operation], value))
+        for depth, value in new_position["time_to_depth"].items():
+            if depth in old_position["time_to_depth"]:
+                metrics.append((f"time_to_depth {depth}", old_position["time_to_depth"][depth], value))
+
+        for metric, old_value, new_value in metrics:
+            if not old_value or not new_value:
+                continue
+            if metric.endswith(HIGHER_IS_BETTER):
+                change = old_value / new_value - 1
+            else:
+                change = new_value / old_value - 1
+            marker = "REGRESSION" if change > threshold else ""
+            print(f"{name:14} {metric:30} {old_value:14.4g} -> {new_value:14.4g} {-change:+8.1%} {marker}")
+            if marker:
+                problems.append(f"{name}: {metric} is {change:.1%} worse")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures how fast the engine is on a fixed set of positions")
+    parser.add_argument("--output", help="write the results to this JSON file (printed if not given)")
+    parser.add_argument("--perft-depth", type=int, default=5, help="deepest perft count")
+    parser.add_argument("--search-depth", type=int, default=6, help="deepest fixed depth search")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="compare two results files instead of running the benchmarks")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="how much worse (a fraction) a timing can get before it counts as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as file:
+            old = json.load(file)
+        with open(args.compare[1]) as file:
+            new = json.load(file)
+        problems = compare(old, new, args.threshold)
+        for problem in problems:
+            print(problem)
+        sys.exit(1 if problems else 0)
+
+    results = run(args.perft_depth, args.search_depth)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import json
+
+import engine
+
+
+def add_move(entries, position, move, weight):
+    """Adds weight to a move in a position in the book entries being built"""
+    moves = entries.setdefault(position.hash, {})
+    key = (move.start, move.end, move.captured)
+    moves[key] = moves.get(key, 0) + weight
+
+
+def add_move_both_ways(entries, position, move, weight):
+    """Adds a move to the book entries, and the same move on the board turned around by 180 degrees, so it's found
+    whichever color is at the bottom of the board (which is part of the position's hash)
+    """
+    add_move(entries, position, move, weight)
+    turned = engine.Position(engine.rotate_squares(position.red), engine.rotate_squares(position.black),
+                             engine.rotate_squares(position.kings), position.turn, not position.player_color)
+    add_move(entries, turned, engine.Move(31 - move.start, 31 - move.end, engine.rotate_squares(move.captured)),
+             weight)
+
+
+def build_from_search(entries, plies, width, margin, limits):
+    """Searches every position the book leads to, starting from both ways around of the starting position
+    The best move gets the highest weight, moves up to margin worse than it get less, and at most width
+    moves are kept for each position, whose positions are searched in turn, down to plies moves from the start
+    """
+    positions = [engine.new_game(True), engine.new_game(False)]
+    for ply in range(plies):
+        next_positions = {}
+        for num, position in enumerate(positions):
+            print(f"\rply {ply + 1}/{plies}: position {num + 1}/{len(positions)}", end="", flush=True)
+            result = engine.best_move(position, limits)
+            if not result.moves_scored:
+                continue
+            # Scores from the side whose turn it is
+            sign = 1 if position.turn is position.player_color else -1
+            ranked = sorted(result.moves_scored, key=lambda move_score: -sign * move_score[1])[:width]
+            best_score = sign * ranked[0][1]
+            for move, score in ranked:
+                difference = best_score - sign * score
+                if difference > margin:
+                    break
+                add_move(entries, position, move, 100 - 99 * difference / margin if margin else 100)
+                child = engine.apply(position, move)
+                next_positions[child.hash] = child
+        positions = list(next_positions.values())
+        print()
+
+
+def build_from_selfplay(entries, results_path, plies):
+    """Counts the moves played in the games of a selfplay.py results file, after the random opening moves
+    Each time a move is played it gets 2 if that side went on to win, 1 for a draw, nothing if it lost
+    The games are all played with black at the bottom, so the moves are added both ways around
+    """
+    with open(results_path) as file:
+        results = json.load(file)
+    for game in results["results"]:
+        position = engine.new_game()
+        for ply, (start, end, captured) in enumerate(game["moves"][:results["random_plies"] + plies]):
+            move = engine.Move(start, end, captured)
+            if ply >= results["random_plies"]:
+                side = game["black"] if position.turn is True else game["red"]
+                if game["winner"] is None:
+                    add_move_both_ways(entries, position, move, 1)
+                elif game["winner"] == side:
+                    add_move_both_ways(entries, position, move, 2)
+            position = engine.apply(position, move)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds the opening book, from searches or self-play games")
+    parser.add_argument("--plies", type=int, default=10, help="how many moves from the start the book covers")
+    parser.add_argument("--selfplay", help="build from the games in a selfplay.py results file instead of searching")
+    parser.add_argument("--width", type=int, default=2, help="most book moves to keep in each position")
+    parser.add_argument("--margin", type=float, default=0.1,
+                        help="how much worse than the best move a move can score and still go in the book")
+    parser.add_argument("--time", type=float, default=5.0, help="seconds to search each position")
+    parser.add_argument("--depth", type=int, default=engine.MAX_SEARCH_DEPTH, help="deepest search")
+    parser.add_argument("--output", default=engine.BOOK_FILE, help="where to write the book")
+    args = parser.parse_args()
+
+    entries = {}
+    if args.selfplay:
+        build_from_selfplay(entries, args.selfplay, args.plies)
+    else:
+        build_from_search(entries, args.plies, args.width, args.margin,
+                          engine.Limits(args.time, args.depth, use_book=False))
+    engine.write_book(entries, args.output)
+    print(f"{len(entries)} positions, {sum(len(moves) for moves in entries.values())} moves")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1678 @@
+import concurrent.futures
+import ctypes
+import json
+import logging
+import mmap
+import multiprocessing
+import os
+import queue
+import random
+import struct
+import time
+
+try:
+    import numpy
+except ImportError:  # Optional, evaluate_batch() is just slower without it
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+
+def square_index(row, pos):
+    """Converts a square given as row and pos (1 to 8, 1 to 4) into its index in a Position (0 to 31)"""
+    return (row - 1) * 4 + pos - 1
+
+
+def square_row_pos(index):
+    """Converts the index of a square in a Position (0 to 31) back into row and pos (1 to 8, 1 to 4)"""
+    return index // 4 + 1, index % 4 + 1
+
+
+def generate_connections():
+    # This code will generate the connections between the squares on the board
+    # This can be done manually, but it's arguably more interesting to do it algorithmically
+
+    # connections_dict is nested dictionary with {square <tuple>: {connection type <int>: connected square <tuple>}}
+    # Squares and connected squares are tuples specified with row and pos (position in row), (row, pos): 1 to 8, 1 to 4
+    # Connection type ranges from 0 to 3: top right, bottom right, bottom left, top left: from perspective of self
+    connections_dict = {}
+    # Give an index for each square
+    for row in range(1, 9):
+        for position_in_row in range(1, 5):
+            connections_dict[(row, position_in_row)] = {}
+
+    # There are 8 types of squares: Those on each of the 4 edges,
+    # upper right and lower left corners, and the middle ones on even and odd rows
+
+    for square in connections_dict:
+        row = square[0]
+        pos = square[1]  # Position in row
+        # Upper edge squares (excluding top right)
+        if row == 1 and pos in (1, 2, 3):
+            connections_dict[square] = {0: None,
+                                        1: (row + 1, pos + 1),
+                                        2: (row + 1, pos),
+                                        3: None}
+        # Top right square
+        if row == 1 and pos == 4:
+            connections_dict[square] = {0: None,
+                                        1: None,
+                                        2: (row + 1, pos),
+                                        3: None}
+        # Left edge excluding bottom left
+        if row in (2, 4, 6) and pos == 1:
+            connections_dict[square] = {0: (row - 1, pos),
+                                        1: (row + 1, pos),
+                                        2: None,
+                                        3: None}
+        # Center squares on even rows
+        if row in (2, 4, 6) and pos in (2, 3, 4):
+            connections_dict[square] = {0: (row - 1, pos),
+                                        1: (row + 1, pos),
+                                        2: (row + 1, pos - 1),
+                                        3: (row - 1, pos - 1)}
+        # Center squares on odd rows
+        if row in (3, 5, 7) and pos in (1, 2, 3):
+            connections_dict[square] = {0: (row - 1, pos + 1),
+                                        1: (row + 1, pos + 1),
+                                        2: (row + 1, pos),
+                                        3: (row - 1, pos)}
+        # Right edge
+        if row in (3, 5, 7) and pos == 4:
+            connections_dict[square] = {0: None,
+                                        1: None,
+                                        2: (row + 1, pos),
+                                        3: (row - 1, pos)}
+        # Bottom left square
+        if row == 8 and pos == 1:
+            connections_dict[square] = {0: (row - 1, pos),
+                                        1: None,
+                                        2: None,
+                                        3: None}
+        # Bottom row
+        if row == 8 and pos in (2, 3, 4):
+            connections_dict[square] = {0: (row - 1, pos),
+                                        1: None,
+                                        2: None,
+                                        3: (row - 1, pos - 1)}
+
+    return connections_dict
+
+
+def generate_tables(connections_dict):
+    """Turns the connections into flat lookup tables, so move generation only needs one list index per step
+    Both tables are indexed with square * 4 + connection type, squares being indexes in a Position (0 to 31)
+    NEIGHBOURS holds the connected square, JUMPS holds the square two steps away in the same direction
+    (where a piece lands if it captures the neighbour), None if the step goes off the board
+    """
+    neighbours = [None] * 128
+    jumps = [None] * 128
+    for (row, pos), connections in connections_dict.items():
+        square = square_index(row, pos)
+        for connection_type in range(4):
+            connection = connections[connection_type]
+            if connection is not None:
+                neighbours[square * 4 + connection_type] = square_index(*connection)
+                other_side = connections_dict[connection][connection_type]
+                if other_side is not None:
+                    jumps[square * 4 + connection_type] = square_index(*other_side)
+    return neighbours, jumps
+
+
+# The connections never change, so the tables are generated once when the program starts
+NEIGHBOURS, JUMPS = generate_tables(generate_connections())
+
+
+def generate_shifts(neighbours):
+    """Groups the squares by how far away their neighbour in each direction is (as a difference of indexes),
+    so all the pieces in a bitmask can be moved one step at once with a couple of shifts, see shift_squares()
+    SHIFTS[connection type] = [(mask of the squares with that difference, difference), ...]
+    """
+    shifts = []
+    for connection_type in range(4):
+        groups = {}
+        for square in range(32):
+            neighbour = neighbours[square * 4 + connection_type]
+            if neighbour is not None:
+                groups[neighbour - square] = groups.get(neighbour - square, 0) | 1 << square
+        shifts.append([(mask, difference) for difference, mask in groups.items()])
+    return shifts
+
+
+SHIFTS = generate_shifts(NEIGHBOURS)
+
+# Random keys for Zobrist hashing, a Position's hash is the XOR of the keys of every piece on the board,
+# together with the keys for whose turn it is and which color is at the bottom of the board
+# ZOBRIST is indexed with piece type * 32 + square, piece types: 0 red, 1 black, 2 red king, 3 black king
+# The seed is fixed so that every process comes up with the same keys
+_zobrist_random = random.Random(20_240_101)
+ZOBRIST = [_zobrist_random.getrandbits(64) for _ in range(128)]
+ZOBRIST_BLACK_TURN = _zobrist_random.getrandbits(64)
+ZOBRIST_RED_AT_BOTTOM = _zobrist_random.getrandbits(64)
+
+
+class Position:
+    __slots__ = ("red", "black", "kings", "turn", "player_color", "hash", "table", "score")
+
+    def __init__(self, red=0, black=0, kings=0, turn=True, player_color=True, table=None):
+        """Compact version of the board, used by the computer's search
+        Each of the 32 playable squares is one bit, numbered 0 to 31 row by row: index = (row - 1) * 4 + pos - 1
+        red: Bitmask of the squares with a red piece on them
+        black: Bitmask of the squares with a black piece on them
+        kings: Bitmask of the squares with a king on them (of either color)
+        turn: Whose turn it is, False = red, True = black
+        player_color: The color at the bottom of the board, whose pieces move up (the other side's move down)
+        hash: Zobrist hash of the position, kept up to date by move_piece()
+        table: Weight table that score is added up with (see weight_table()), DEFAULT_TABLE if not given
+        score: Sum of the table's values for every piece on the board, also kept up to date by move_piece()
+        """
+
+        self.red = red
+        self.black = black
+        self.kings = kings
+        self.turn = turn
+        self.player_color = player_color
+        self.hash = self.compute_hash()
+        self.table = DEFAULT_TABLE if table is None else table
+        self.score = self.compute_score()
+
+    def copy(self):
+        position = Position.__new__(Position)
+        position.red = self.red
+        position.black = self.black
+        position.kings = self.kings
+        position.turn = self.turn
+        position.player_color = self.player_color
+        position.hash = self.hash
+        position.table = self.table
+        position.score = self.score
+        return position
+
+    def pack(self):
+        """The whole position in a single int, used to send positions to other processes"""
+        return self.red | self.black << 32 | self.kings << 64 | self.turn << 96 | self.player_color << 97
+
+    @classmethod
+    def unpack(cls, packed):
+        """Makes a Position from the result of pack()"""
+        return cls(packed & 0xffffffff, packed >> 32 & 0xffffffff, packed >> 64 & 0xffffffff,
+                   bool(packed >> 96 & 1), bool(packed >> 97 & 1))
+
+    def load(self, packed):
+        """Sets this position to the result of pack() in place, keeping its weight table, so one Position can be
+        reused for search after search instead of making a new one each time
+        """
+        self.red = packed & 0xffffffff
+        self.black = packed >> 32 & 0xffffffff
+        self.kings = packed >> 64 & 0xffffffff
+        self.turn = bool(packed >> 96 & 1)
+        self.player_color = bool(packed >> 97 & 1)
+        self.hash = self.compute_hash()
+        self.score = self.compute_score()
+
+    def compute_hash(self):
+        """Zobrist hash of the position from scratch, move_piece() updates it incrementally instead"""
+        hash_value = 0
+        for square in range(32):
+            bit = 1 << square
+            if (self.red | self.black) & bit:
+                piece_type = (2 if self.kings & bit else 0) + (1 if self.black & bit else 0)
+                hash_value ^= ZOBRIST[piece_type * 32 + square]
+        if self.turn is True:
+            hash_value ^= ZOBRIST_BLACK_TURN
+        if self.player_color is False:
+            hash_value ^= ZOBRIST_RED_AT_BOTTOM
+        return hash_value
+
+    def compute_score(self, table=None):
+        """Score of the position from scratch with a weight table (the position's own if not given), that is the
+        dot product of the table with which squares each type of piece is on, move_piece() updates it incrementally
+        """
+        if table is None:
+            table = self.table
+        if self.player_color is True:
+            bottom, top = self.black, self.red
+        else:
+            bottom, top = self.red, self.black
+        score = 0
+        for piece_type, pieces in enumerate((bottom & ~self.kings, top & ~self.kings,
+                                             bottom & self.kings, top & self.kings)):
+            while pieces:
+                bit = pieces & -pieces
+                score += table[piece_type * 32 + bit.bit_length() - 1]
+                pieces ^= bit
+        return score
+
+    def use_table(self, table):
+        """Switches to scoring the position with a different weight table"""
+        self.table = table
+        self.score = self.compute_score()
+
+    def color_at(self, index):
+        """Color of the piece on a square: False = red, True = black, None if the square is empty"""
+        bit = 1 << index
+        if self.red & bit:
+            return False
+        if self.black & bit:
+            return True
+        return None
+
+
+class Move:
+    __slots__ = ("start", "end", "captured")
+
+    def __init__(self, start, end, captured=0):
+        """One possible move, as made by move_piece(), it's never changed once it's made so it can be hashed
+        start: Index of the square the piece moves from
+        end: Index of the square the piece ends up on (the same as start if a king jumps around in a circle)
+        captured: Bitmask of the squares of the pieces it captures, 0 for a normal move
+        """
+
+        # Set around __setattr__(), which stops them from being changed afterwards
+        object.__setattr__(self, "start", start)
+        object.__setattr__(self, "end", end)
+        object.__setattr__(self, "captured", captured)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("a Move can't be changed once it's made")
+
+    def pack(self):
+        """The whole move in a single int"""
+        return self.start | self.end << 5 | self.captured << 10
+
+    @classmethod
+    def unpack(cls, packed):
+        """Makes a Move from the result of pack()"""
+        return cls(packed & 31, packed >> 5 & 31, packed >> 10)
+
+    def __eq__(self, other):
+        return isinstance(other, Move) and self.start == other.start and self.end == other.end \
+            and self.captured == other.captured
+
+    def __hash__(self):
+        return self.pack()
+
+    def __reduce__(self):
+        # Much smaller when sent to other processes than the default for classes with __slots__
+        return Move, (self.start, self.end, self.captured)
+
+    def __repr__(self):
+        return f"Move({self.start}, {self.end}, {self.captured:#x})"
+
+
+# Every normal (non capturing) move, indexed like NEIGHBOURS, Moves can't be changed so the same ones are handed out
+# by every search instead of making new ones
+STEPS = [Move(index // 4, end) if end is not None else None for index, end in enumerate(NEIGHBOURS)]
+
+
+def mask_squares(mask):
+    """The indexes of the squares in a bitmask, lowest first"""
+    squares = []
+    while mask:
+        bit = mask & -mask
+        squares.append(bit.bit_length() - 1)
+        mask ^= bit
+    return squares
+
+
+def move_piece(position, move, player_color):
+    """Make a Move in place, moving a piece from its start square to its end square and taking the pieces it
+    captures off the board, and pass the turn on
+    Returns the undo information that unmake_move() needs to take the move back
+    """
+    undo = (position.red, position.black, position.kings, position.turn, position.hash, position.score)
+
+    start = move.start
+    end = move.end
+    captured_mask = move.captured
+    start_bit = 1 << start
+    end_bit = 1 << end
+
+    if position.red & start_bit:
+        color = False
+        piece_type = 0
+    else:
+        color = True
+        piece_type = 1
+    if position.kings & start_bit:
+        piece_type += 2
+    hash_value = position.hash ^ ZOBRIST[piece_type * 32 + start] ^ ZOBRIST_BLACK_TURN
+    # Type of the piece that's moving in the weight table, see weight_table()
+    table = position.table
+    top = 0 if color is player_color else 1
+    score = position.score - table[(top + (piece_type & 2)) * 32 + start]
+
+    remaining = captured_mask
+    while remaining:
+        captured_bit = remaining & -remaining
+        remaining ^= captured_bit
+        captured_square = captured_bit.bit_length() - 1
+        captured_type = (2 if position.kings & captured_bit else 0) + (0 if color else 1)
+        hash_value ^= ZOBRIST[captured_type * 32 + captured_square]
+        score -= table[(1 - top + (captured_type & 2)) * 32 + captured_square]
+
+    # Written so that it also works when a king jumps in a circle back to where it started
+    if color is False:
+        position.red = position.red & ~start_bit | end_bit
+        position.black &= ~captured_mask
+    else:
+        position.black = position.black & ~start_bit | end_bit
+        position.red &= ~captured_mask
+    if position.kings & start_bit:
+        position.kings = position.kings & ~start_bit | end_bit
+    position.kings &= ~captured_mask
+
+    # Check to make the piece king if necessary
+    if piece_type < 2:
+        # If piece is from the side at the top, it needs to reach row 8
+        # If piece is from the side at the bottom, it needs to reach row 1
+        if color is not player_color and end >= 28 or color is player_color and end < 4:
+            position.kings |= end_bit
+            piece_type += 2
+    position.hash = hash_value ^ ZOBRIST[piece_type * 32 + end]
+    position.score = score + table[(top + (piece_type & 2)) * 32 + end]
+    position.turn = not color
+
+    return undo
+
+
+def unmake_move(position, undo):
+    """Take back a move made by move_piece()"""
+    position.red, position.black, position.kings, position.turn, position.hash, position.score = undo
+
+
+def find_moves(position, side, player_color):
+    """Finds all the possible moves for a certain side (red or black), from a certain board position (Position)"""
+    return list(generate_moves(position, side, player_color))
+
+
+def generate_moves(position, side, player_color):
+    """Yields the possible moves for a certain side one at a time, so whatever is looking at them can stop early
+    Whether there are any jumps is checked for all the pieces at once first, since if there are, they are the only
+    possible moves (force jump rule), and otherwise no piece needs to look for jumps
+    """
+    pieces = position.red if side is False else position.black
+
+    if has_capture(position, side, player_color):
+        remaining = pieces
+        while remaining:
+            bit = remaining & -remaining
+            remaining ^= bit
+            yield from find_jumps(bit.bit_length() - 1, position, player_color)
+        return
+
+    empty = ~(position.red | position.black)
+    forwards = [1, 2] if side is not player_color else [0, 3]
+    remaining = pieces
+    while remaining:
+        bit = remaining & -remaining
+        remaining ^= bit
+        square = bit.bit_length() - 1
+        for connection_type in ([0, 1, 2, 3] if position.kings & bit else forwards):
+            end = NEIGHBOURS[square * 4 + connection_type]
+            if end is not None and empty & 1 << end:
+                yield STEPS[square * 4 + connection_type]
+
+
+def search(start, position, player_color):
+    """Finds all the possible moves for the piece on a certain square"""
+    # position is what game board it's going to search on
+
+    # start is which square index to start the search from
+    # search() outputs list [Move, ...], the same end square can show up more than once if different pieces can be
+    # captured on the way
+
+    # Implement the force jump rule for each piece,
+    # meaning that if a piece has available jumps, it must take one of them, rather than an ordinary move
+    moves = find_jumps(start, position, player_color)
+    if moves:
+        return moves
+
+    occupied = position.red | position.black
+    for connection_type in allowed_connections(start, position, player_color):
+        connection_square = NEIGHBOURS[start * 4 + connection_type]
+        # If there is no piece on the connected square, it is a possible move
+        if connection_square is not None and not occupied & 1 << connection_square:
+            moves.append(STEPS[start * 4 + connection_type])
+
+    return moves
+
+
+def allowed_connections(start, position, player_color):
+    """The directions (connection types) the piece on a certain square can move in"""
+    start_bit = 1 << start
+    # Make sure that if the piece isn't a king, that it doesn't jump backwards
+    # Only need to check this extra thing if the piece isn't a king
+    if position.kings & start_bit:
+        return [0, 1, 2, 3]
+    # If the piece is at the top of the board
+    if bool(position.black & start_bit) is not player_color:
+        # Can only move downwards (forwards from the top side's perspective)
+        return [1, 2]
+    # If the piece is at the bottom of the board
+    # Can only move upwards (forwards from the bottom side's perspective)
+    return [0, 3]
+
+
+def find_jumps(start, position, player_color):
+    """Finds all the jumps the piece on a certain square can make, [Move, ...]"""
+    moves = []
+
+    start_bit = 1 << start
+    opponent = position.black if position.red & start_bit else position.red
+    # The piece has left the start square once it moves, so a king can jump back over or onto it
+    occupied = (position.red | position.black) & ~start_bit
+    allowed_jumps = allowed_connections(start, position, player_color)
+
+    # Follow every chain of jumps to its end, each chain keeps track of the pieces it has captured itself,
+    # they stay on the board until the move is over, so they can't be jumped twice or landed on
+    def find_all_jumps(start_from, captured):
+        end_reached = True
+        for connection_type in allowed_jumps:
+            connection_square = NEIGHBOURS[start_from * 4 + connection_type]
+            other_side_square = JUMPS[start_from * 4 + connection_type]
+            if other_side_square is not None \
+                    and opponent & 1 << connection_square \
+                    and not captured & 1 << connection_square \
+                    and not occupied & 1 << other_side_square:
+                end_reached = False
+                find_all_jumps(other_side_square, captured | 1 << connection_square)
+
+        if end_reached and captured:
+            # Chains that capture the same pieces in a different order (a king going around in a circle) are
+            # the same move
+            move = Move(start, start_from, captured)
+            if move not in moves:
+                moves.append(move)
+
+    find_all_jumps(start, 0)
+    return moves
+
+
+def shift_squares(squares, connection_type):
+    """Moves every square in a bitmask one step in a direction, squares that would go off the board are dropped"""
+    shifted = 0
+    for mask, difference in SHIFTS[connection_type]:
+        if difference > 0:
+            shifted |= (squares & mask) << difference
+        else:
+            shifted |= (squares & mask) >> -difference
+    return shifted
+
+
+def has_capture(position, side, player_color):
+    """Whether a certain side has a jump available, checked for all of its pieces at once"""
+    if side is False:
+        pieces, opponent = position.red, position.black
+    else:
+        pieces, opponent = position.black, position.red
+    empty = ~(position.red | position.black) & 0xffffffff
+    # Normal pieces at the top can only move down, normal pieces at the bottom only up
+    forwards = (1, 2) if side is not player_color else (0, 3)
+    for connection_type in range(4):
+        movers = pieces if connection_type in forwards else pieces & position.kings
+        if movers and shift_squares(shift_squares(movers, connection_type) & opponent, connection_type) & empty:
+            return True
+    return False
+
+
+def has_any_move(position, side, player_color):
+    """Whether a certain side can move at all, checked for all of its pieces at once"""
+    pieces = position.red if side is False else position.black
+    empty = ~(position.red | position.black) & 0xffffffff
+    forwards = (1, 2) if side is not player_color else (0, 3)
+    for connection_type in range(4):
+        movers = pieces if connection_type in forwards else pieces & position.kings
+        if movers and shift_squares(movers, connection_type) & empty:
+            return True
+    return has_capture(position, side, player_color)
+
+
+# Seconds the computer may think for each move, it searches one ply deeper at a time until this runs out
+TIME_BUDGET = 2.0
+# Deepest search it will start, even if there is time left
+MAX_SEARCH_DEPTH = 40
+# Most plies the quiescence search goes on for past the search depth, so a long series of captures can't make
+# a search take forever
+QUIESCENCE_MAX_PLIES = 12
+# Number of worker processes searching for the computer, None for one per CPU
+WORKERS = None
+
+# Transposition table settings, the table is shared by all the worker processes
+TT_SIZE_MB = 64
+# "depth" keeps whichever result was searched deeper when two positions share a slot, "always" keeps the newest
+TT_REPLACEMENT = "depth"
+
+# Default values of the scoring scheme used by evaluate(), see there
+WEIGHTS = {"piece": 1, "king": 3, "center": 0.1, "inner_center": 0.05, "back_row": 0.5}
+
+# Names of the four weight tables in a weights file, in the order they're stored in a weight table
+# The side at the bottom of the board is the player's, the side at the top is the computer's
+TABLE_NAMES = ("bottom_man", "top_man", "bottom_king", "top_king")
+# Weights file the computer plays with, the table is made from WEIGHTS if it doesn't exist
+WEIGHTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "weights.json")
+
+
+def weight_table(weights=None):
+    """Makes a weight table out of the scoring scheme (a dict like WEIGHTS, WEIGHTS if not given)
+    A weight table is a list of what a piece on each square is worth, indexed with piece type * 32 + square,
+    piece types as in TABLE_NAMES, the values for the side at the top are negative,
+    so the score of a position (from the player's perspective) is the sum of the values of all the pieces
+    """
+    if weights is None:
+        weights = WEIGHTS
+    table = [0] * 128
+    for piece_type in range(4):
+        top = piece_type & 1
+        king = piece_type & 2
+        for square in range(32):
+            row, pos = square_row_pos(square)
+            value = weights["king"] if king else weights["piece"]
+            # Check if piece is in center of board, slightly better position
+            if row in [3, 4, 5, 6] and pos in [2, 3]:
+                value += weights["center"]
+            if row == 4 and pos == 3 or row == 5 and pos == 2:
+                value += weights["inner_center"]
+            # Check for the back row pieces
+            if not king and (row == 1 and pos in [1, 3] if top else row == 8 and pos in [2, 4]):
+                value += weights["back_row"]
+            table[piece_type * 32 + square] = -value if top else value
+    return table
+
+
+def load_weights(path):
+    """Reads a weight table from a JSON file
+    The file either holds the scoring scheme (some of the keys in WEIGHTS, the rest keep their default values),
+    or tables named like in TABLE_NAMES, each one 8 rows of 4 values, with positive values being good for the side
+    the table is for (tables that aren't in the file are made from WEIGHTS)
+    """
+    with open(path) as file:
+        weights = json.load(file)
+
+    if set(weights) <= set(WEIGHTS):
+        return weight_table(dict(WEIGHTS, **weights))
+    if not set(weights) <= set(TABLE_NAMES):
+        raise ValueError(f"unknown weights in {path}: {', '.join(sorted(set(weights) - set(TABLE_NAMES)))}")
+
+    table = weight_table()
+    for piece_type, name in enumerate(TABLE_NAMES):
+        if name in weights:
+            rows = weights[name]
+            if len(rows) != 8 or any(len(row) != 4 for row in rows):
+                raise ValueError(f"{name} in {path} should be 8 rows of 4 values")
+            for row in range(8):
+                for pos in range(4):
+                    value = float(rows[row][pos])
+                    table[piece_type * 32 + row * 4 + pos] = -value if piece_type & 1 else value
+    return table
+
+
+def save_weights(table, path):
+    """Writes a weight table to a JSON file that load_weights() can read, one row of the board per line"""
+    lines = []
+    for piece_type, name in enumerate(TABLE_NAMES):
+        sign = -1 if piece_type & 1 else 1
+        rows = []
+        for row in range(8):
+            values = [round(sign * table[piece_type * 32 + row * 4 + pos], 10) + 0 for pos in range(4)]
+            rows.append("    " + json.dumps(values))
+        lines.append(f'  "{name}": [\n' + ",\n".join(rows) + "\n  ]")
+    with open(path, "w") as file:
+        file.write("{\n" + ",\n".join(lines) + "\n}\n")
+
+
+if os.path.exists(WEIGHTS_FILE):
+    DEFAULT_TABLE = load_weights(WEIGHTS_FILE)
+else:
+    DEFAULT_TABLE = weight_table()
+
+
+def evaluate(position, player_color, weights=None):
+    """Gives a score to a board position, from the player's perspective (+ = player is winning)
+    weights: Weight table to score with (see weight_table()), the position's own table if not given
+    """
+    # Analyze the current board situation to give it a score
+    # Looking for how many pieces each side has
+
+    # TODO Add endgame strategy algorithm
+    # TODO Add king chasing down opponent pieces and cornering opponent king feature
+
+    # TODO Add piece formation and overextension evaluation
+
+    # todo Change program into C++ to run faster
+
+    # TODO Add repetition escape feature if computer is winning
+    # TODO Add start using the king more if one side has a king and the other side doesn't
+
+    # TODO Add more advanced king detection, where there are no pieces blocking it, not just nearing end-zone
+
+    # TODO Use neural nets to play better
+
+    # The scoring scheme can be adjusted without changing the code by editing the tables in weights.json
+    # Default scoring scheme (WEIGHTS):
+    # 1 for normal piece, 3 for king
+    # +0.1 if it's in the center 4x4
+    # an additional +0.05 on top of that if it's in the center 2x2
+
+    # +0.5 bonus if it's a normal piece, and it's on one of the two back row squares
+    # that control the whole back area
+    # The scheme is turned into per square values by weight_table(), and the score is kept up to date
+    # as pieces move, so this doesn't need to look at every square
+    if weights is None or weights is position.table:
+        score = position.score
+    else:
+        score = position.compute_score(weights)
+
+    # todo How to implement endgame strategy?
+    # Provide incentive to move towards opponent's pieces if computer is winning?
+    # And stay near safe corners if losing
+    # Advance regular pieces to get more kings if winning
+    # fixme Problem that computer will sacrifice pieces to try to prevent king?
+
+    # The table is from the point of view of the side at the bottom of the board
+    if player_color is not position.player_color:
+        return -score
+    return score
+
+
+def evaluate_batch(positions, weights=None):
+    """Scores many positions at once with a weight table (DEFAULT_TABLE if not given), returns a list of scores,
+    each from the perspective of the position's player_color
+    With NumPy this is a single matrix product of the pieces on each square with the table
+    """
+    if weights is None:
+        weights = DEFAULT_TABLE
+    if numpy is None:
+        return [position.compute_score(weights) for position in positions]
+
+    # One row per position of bitmasks for each piece type, in the same order as in the weight table
+    masks = numpy.empty((len(positions), 4), dtype=numpy.uint64)
+    for num, position in enumerate(positions):
+        if position.player_color is True:
+            bottom, top = position.black, position.red
+        else:
+            bottom, top = position.red, position.black
+        men = ~position.kings
+        masks[num] = bottom & men, top & men, bottom & position.kings, top & position.kings
+    # Unpack the bitmasks into 0 or 1 for each square, so each row lines up with the weight table
+    occupancy = masks[:, :, None] >> numpy.arange(32, dtype=numpy.uint64) & numpy.uint64(1)
+    return (occupancy.reshape(len(positions), 128) @ numpy.array(weights, dtype=numpy.float64)).tolist()
+
+
+# Bound types of transposition table entries
+EXACT = 0
+LOWER = 1  # The real score is at least the stored score (the search was cut off by beta)
+UPPER = 2  # The real score is at most the stored score (no move beat alpha)
+
+
+class TranspositionTable:
+    # Bytes used by one entry: the key, the score, and depth, bound and best move packed together
+    ENTRY_SIZE = 24
+
+    def __init__(self, size_mb=TT_SIZE_MB, replacement=TT_REPLACEMENT, buffer=None):
+        """Fixed size store of search results, so a position reached by different move orders is only searched once
+        size_mb: Memory cap, the table gets the largest power of two number of entries that fits in it
+        replacement: "depth" or "always", what to do when a different position already uses the slot
+        buffer: Memory to keep the entries in, at least buffer_size(size_mb) bytes,
+        pass shared memory to share one table between processes, a new bytearray is used if not given
+        hits, misses, collisions: Probe counters, a collision is a miss where the slot held a different position
+        generation: Which search the entries being stored belong to, entries from older searches are always replaced
+        """
+
+        if replacement not in ("depth", "always"):
+            raise ValueError(f"unknown replacement policy {replacement!r}")
+        self.replacement = replacement
+        self.size = self.buffer_size(size_mb) // self.ENTRY_SIZE
+        self.mask = self.size - 1
+
+        # The entries live in one fixed block of memory, split into typed views
+        if buffer is None:
+            buffer = bytearray(self.size * self.ENTRY_SIZE)
+        self.buffer = buffer
+        view = memoryview(buffer).cast("B")
+        self.keys = view[:self.size * 8].cast("Q")
+        self.scores = view[self.size * 8:self.size * 16].cast("d")
+        self.score_bits = view[self.size * 8:self.size * 16].cast("Q")
+        self.data = view[self.size * 16:self.size * 24].cast("Q")
+
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.generation = 0
+
+    @classmethod
+    def buffer_size(cls, size_mb):
+        """Bytes needed for a table with a memory cap of size_mb"""
+        return cls.ENTRY_SIZE << max(size_mb * 1024 * 1024 // cls.ENTRY_SIZE, 1).bit_length() - 1
+
+    def probe(self, key, count=True):
+        """Looks up a position, returns (depth, bound, score, best move) or None if it isn't stored
+        count: Whether to count the lookup in the hit and miss counters
+        """
+        index = key & self.mask
+        data = self.data[index]
+        score = self.scores[index]
+        # The key is stored XORed with the rest of the entry, so an entry that another process was halfway through
+        # writing doesn't match any key, instead of giving a score from one position with the move of another
+        stored_key = self.keys[index] ^ data ^ self.score_bits[index]
+        if stored_key == key:
+            if count:
+                self.hits += 1
+            move = data >> 16
+            if move:
+                move = ((move >> 5) - 1, move & 31)
+            else:
+                move = None
+            return (data & 0xff) - 128, data >> 8 & 3, score, move
+
+        if count:
+            self.misses += 1
+            if stored_key != 0:
+                self.collisions += 1
+        return None
+
+    def store(self, key, depth, bound, score, move):
+        """Saves a search result
+        depth: How many plies the score was searched for, compared against later searches of the same position
+        move: (start, end) of the best move found, or None
+        """
+        index = key & self.mask
+        if self.replacement == "depth":
+            stored_data = self.data[index]
+            stored_key = self.keys[index] ^ stored_data ^ self.score_bits[index]
+            if stored_key != 0 and stored_key != key:
+                if stored_data >> 10 & 63 == self.generation and (stored_data & 0xff) - 128 > depth:
+                    return
+
+        # Pack the best move as (start + 1) * 32 + end, so that 0 means no move
+        packed_move = 0 if move is None else (move[0] + 1) * 32 + move[1]
+        data = packed_move << 16 | self.generation << 10 | bound << 8 | max(min(depth, 127), -128) + 128
+        self.scores[index] = score
+        self.data[index] = data
+        self.keys[index] = key ^ data ^ self.score_bits[index]
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "collisions": self.collisions}
+
+
+# Folder with the endgame tablebase files made by tablebase.py
+TABLEBASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases")
+# Score of a position that the tablebase says is won, minus the number of plies until the win, so quicker wins
+# score higher (still less than actually having won, see negamax())
+TABLEBASE_WIN = 900_000
+
+# Binomial coefficients, BINOMIAL[n][k] = n choose k, for indexing tablebase positions
+BINOMIAL = [[0] * 33 for _ in range(33)]
+for _n in range(33):
+    BINOMIAL[_n][0] = 1
+    for _k in range(1, _n + 1):
+        BINOMIAL[_n][_k] = BINOMIAL[_n - 1][_k - 1] + BINOMIAL[_n - 1][_k]
+
+# Reversed bits of every byte, used to turn the board around
+_REVERSED_BYTES = [int(f"{byte:08b}"[::-1], 2) for byte in range(256)]
+
+
+def rotate_squares(squares):
+    """Turns a bitmask of squares around by 180 degrees (square index -> 31 - index)"""
+    return _REVERSED_BYTES[squares & 0xff] << 24 | _REVERSED_BYTES[squares >> 8 & 0xff] << 16 \
+        | _REVERSED_BYTES[squares >> 16 & 0xff] << 8 | _REVERSED_BYTES[squares >> 24]
+
+
+def tablebase_groups(position):
+    """The position as the tablebase sees it: (own men, own kings, opponent men, opponent kings) of the side whose
+    turn it is, turned around if needed so that the side whose turn it is is at the bottom of the board
+    """
+    if position.turn is False:
+        own, opponent = position.red, position.black
+    else:
+        own, opponent = position.black, position.red
+    groups = (own & ~position.kings, own & position.kings, opponent & ~position.kings, opponent & position.kings)
+    if position.turn is not position.player_color:
+        groups = tuple(rotate_squares(group) for group in groups)
+    return groups
+
+
+def tablebase_size(signature):
+    """Number of entries in the tablebase file for a signature: (own men, own kings, opponent men, opponent kings)"""
+    size = 1
+    free = 32
+    for count in signature:
+        size *= BINOMIAL[free][count]
+        free -= count
+    return size
+
+
+def tablebase_index(groups):
+    """Index of a position (see tablebase_groups()) in the file of its signature
+    Each group of pieces is numbered as a combination of the squares that the groups before it left free
+    """
+    index = 0
+    occupied = 0
+    for group in groups:
+        count = group.bit_count()
+        rank = 0
+        num = 0
+        remaining = group
+        while remaining:
+            bit = remaining & -remaining
+            remaining ^= bit
+            num += 1
+            # Square number among the squares that are still free
+            rank += BINOMIAL[bit.bit_length() - 1 - (occupied & bit - 1).bit_count()][num]
+        index = index * BINOMIAL[32 - occupied.bit_count()][count] + rank
+        occupied |= group
+    return index
+
+
+def tablebase_file(directory, signature):
+    return os.path.join(directory, "".join(str(count) for count in signature) + ".tb")
+
+
+class Tablebase:
+    def __init__(self, directory=TABLEBASE_DIR):
+        """Endgame tablebase files, each one is only opened (memory mapped) once a position from it is looked up
+        directory: Folder with the files
+        max_pieces: Most pieces on the board in any of the files, 0 if there are none
+        files: {signature: mmap, or None if there is no file for the signature}
+        """
+
+        self.directory = directory
+        self.files = {}
+        self.max_pieces = 0
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                stem, extension = os.path.splitext(name)
+                if extension == ".tb" and len(stem) == 4 and stem.isdigit():
+                    self.max_pieces = max(self.max_pieces, sum(int(count) for count in stem))
+
+    def open(self, signature):
+        if signature not in self.files:
+            path = tablebase_file(self.directory, signature)
+            if os.path.exists(path):
+                with open(path, "rb") as file:
+                    self.files[signature] = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.files[signature] = None
+        return self.files[signature]
+
+    def probe(self, position):
+        """Looks a position up, returns its score for the side whose turn it is (+ TABLEBASE_WIN - plies to win
+        if it's winning, 0 for a draw, - TABLEBASE_WIN + plies to lose if it's losing), None if it isn't covered
+        """
+        if (position.red | position.black).bit_count() > self.max_pieces:
+            return None
+        groups = tablebase_groups(position)
+        file = self.open(tuple(group.bit_count() for group in groups))
+        if file is None:
+            return None
+        # One byte per position: 0 draw, 1 to 127 win in that many plies, 128 + n loss in n plies
+        value = file[tablebase_index(groups)]
+        if value == 0:
+            return 0
+        if value < 128:
+            return TABLEBASE_WIN - value
+        return -TABLEBASE_WIN + value - 128
+
+
+# Opened the first time it's needed in each process
+_tablebase = None
+
+
+def default_tablebase():
+    """The Tablebase in TABLEBASE_DIR, shared by all the searches in this process"""
+    global _tablebase
+    if _tablebase is None:
+        _tablebase = Tablebase()
+    return _tablebase
+
+
+# Opening book file made by book.py
+BOOK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "book.bin")
+# One record per book move, sorted by position hash: hash, bitmask of the captured squares, weight, start, end
+BOOK_RECORD = struct.Struct("<QIHBB")
+
+
+class OpeningBook:
+    def __init__(self, path=BOOK_FILE):
+        """Moves to play in positions near the start of the game, looked up by the position's hash
+        path: The book file, the book is empty if it doesn't exist
+        data: The file memory mapped, opened the first time a position is looked up
+        """
+
+        self.path = path
+        self.data = None
+        self.records = 0
+
+    def lookup(self, position):
+        """Moves for a position from the book: [[move, weight], ...], empty if it isn't in the book"""
+        if self.data is None:
+            if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+                return []
+            with open(self.path, "rb") as file:
+                self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.records = len(self.data) // BOOK_RECORD.size
+
+        # Binary search for the first record of the position
+        key = position.hash
+        low, high = 0, self.records
+        while low < high:
+            middle = (low + high) // 2
+            if struct.unpack_from("<Q", self.data, middle * BOOK_RECORD.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        book_moves = {}
+        while low < self.records:
+            record_key, captured_mask, weight, start, end = BOOK_RECORD.unpack_from(self.data, low * BOOK_RECORD.size)
+            if record_key != key:
+                break
+            book_moves[start, end, captured_mask] = weight
+            low += 1
+        if not book_moves:
+            return []
+
+        # Match them up with the possible moves, in case two positions have the same hash
+        found = []
+        for move in legal_moves(position):
+            if (move.start, move.end, move.captured) in book_moves:
+                found.append([move, book_moves[move.start, move.end, move.captured]])
+        return found
+
+    def choose(self, position):
+        """Picks one of the book moves for a position at random, more likely the higher its weight, None if the
+        position isn't in the book
+        """
+        found = self.lookup(position)
+        if not found:
+            return None
+        return random.choices([move for move, _ in found], [weight for _, weight in found])[0]
+
+
+def write_book(entries, path):
+    """Writes a book file, entries: {position hash: {(start, end, captured mask): weight, ...}, ...}"""
+    with open(path, "wb") as file:
+        for key in sorted(entries):
+            for (start, end, captured_mask), weight in sorted(entries[key].items()):
+                file.write(BOOK_RECORD.pack(key, captured_mask, min(max(round(weight), 1), 0xffff), start, end))
+
+
+# Opened the first time it's needed
+_book = None
+
+
+def default_book():
+    """The OpeningBook in BOOK_FILE"""
+    global _book
+    if _book is None:
+        _book = OpeningBook()
+    return _book
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search when its deadline has passed"""
+
+
+class SearchState:
+    def __init__(self, table=None, deadline=None, pv=(), stop_event=None, weights=None, tablebase=None):
+        """Information collected during one search, used to look at the most promising moves first
+        killers: {depth <int>: [(start, end), ...]}, the last two quiet moves that caused a cutoff at each depth
+        history: How much each (start, end) quiet move has caused cutoffs, indexed with start * 32 + end
+        table: TranspositionTable that results are stored in, a new one is made if not given
+        deadline: time.time() after which the search raises SearchTimeout, None for no limit
+        stop_event: multiprocessing.Event that makes the search raise SearchTimeout once it is set
+        weights: Weight table for evaluate() (see weight_table()), the position's own if not given
+        tablebase: Tablebase that positions with few pieces are looked up in, default_tablebase() if not given
+        pv: Principal variation [(start, end), ...] from the previous iteration, which is searched first
+        pv_table: {depth <int>: [(start, end), ...]}, the best line found so far from each depth
+        search_depth: Depth of the iteration being searched
+        nodes: How many positions have been searched
+        evaluations: How many positions have been scored with evaluate()
+        quiescence_nodes: How many of the nodes were in the quiescence search
+        quiescence_limit: How many times the quiescence search stopped at QUIESCENCE_MAX_PLIES with the position still
+        not quiet, lots of these mean long series of captures that aren't being followed to the end
+        tablebase_hits: How many positions were looked up in the tablebase
+        max_depth: Deepest ply from the root that was reached, counting the quiescence search
+        """
+
+        self.killers = {}
+        self.history = [0] * 1024
+        if table is None:
+            table = TranspositionTable()
+        self.table = table
+        self.deadline = deadline
+        self.stop_event = stop_event
+        self.weights = weights
+        if tablebase is None:
+            tablebase = default_tablebase()
+        self.tablebase = tablebase
+        self.pv = list(pv)
+        self.follow_pv = bool(pv)
+        self.pv_table = {}
+        self.search_depth = 0
+        self.nodes = 0
+        self.evaluations = 0
+        self.quiescence_nodes = 0
+        self.quiescence_limit = 0
+        self.tablebase_hits = 0
+        self.max_depth = 0
+
+    def out_of_time(self):
+        """Whether the deadline has passed, or the search has been asked to stop"""
+        if self.stop_event is not None and self.stop_event.is_set():
+            return True
+        return self.deadline is not None and time.time() > self.deadline
+
+
+def order_moves(moves, position, depth, player_color, state, best_move=None):
+    """Sorts moves so the ones most likely to cause a cutoff come first: the best move found in an earlier search,
+    captures (most pieces captured first), then promotions, then killer moves, then by history score
+    """
+    killers = state.killers.get(depth, [])
+    history = state.history
+
+    def move_order(move):
+        start = move.start
+        end = move.end
+        if (start, end) == best_move:
+            return -1, 0
+        if move.captured:
+            return 0, -move.captured.bit_count()
+        if not position.kings & 1 << start:
+            # A normal piece reaching the other side gets promoted
+            if position.color_at(start) is player_color:
+                if end < 4:
+                    return 1, 0
+            elif end >= 28:
+                return 1, 0
+        if (start, end) in killers:
+            return 2, killers.index((start, end))
+        return 3, -history[start * 32 + end]
+
+    return sorted(moves, key=move_order)
+
+
+def quiescence(position, turn, ply, player_color, alpha, beta, state):
+    """Carries on from the end of the main search, only looking at captures and promotions, until the position is
+    quiet enough for evaluate() to be trusted, otherwise a capture may be seen, but not the recapture afterwards
+    ply: How many plies into the quiescence search this is, it stops at QUIESCENCE_MAX_PLIES
+    Scores are from the perspective of the side whose turn it is, like negamax()
+    """
+    state.nodes += 1
+    if state.nodes & 1023 == 0 and state.out_of_time():
+        raise SearchTimeout
+    state.quiescence_nodes += 1
+    if state.search_depth + ply > state.max_depth:
+        state.max_depth = state.search_depth + ply
+
+    if state.tablebase.max_pieces:
+        score = state.tablebase.probe(position)
+        if score is not None:
+            state.tablebase_hits += 1
+            return score
+
+    # Whether there's a capture, and whether there are any moves, is quick to check for all the pieces at once,
+    # the moves only need to be found if there's something to follow up
+    capturing = has_capture(position, turn, player_color)
+    if not capturing and not has_any_move(position, turn, player_color):
+        # If there are no more possible moves, the side whose turn it is has lost
+        return -1_000_000
+
+    stand_pat = evaluate(position, player_color, state.weights)
+    state.evaluations += 1
+    if turn is not player_color:
+        stand_pat = -stand_pat
+    if ply >= QUIESCENCE_MAX_PLIES:
+        if capturing:
+            state.quiescence_limit += 1
+        return stand_pat
+
+    if capturing:
+        # Captures are forced, so the side to move can't choose to stop here (stand pat)
+        best_value = None
+        moves = sorted(find_moves(position, turn, player_color), key=lambda move: -move.captured.bit_count())
+    else:
+        # Stopping here is an option, so if it's already good enough, there's no need to look further
+        if stand_pat >= beta:
+            return stand_pat
+        # Only normal pieces one step away from the other side can get promoted
+        own = position.red if turn is False else position.black
+        promoting = own & ~position.kings & (0xf0 if turn is player_color else 0x0f000000)
+        if not promoting:
+            return stand_pat
+        best_value = stand_pat
+        alpha = max(alpha, stand_pat)
+        # Generated as they're needed, so a cutoff from the first promotion saves finding the rest of the moves
+        # (each move is taken back before the next one is generated, so the position is the same every time)
+        moves = (move for move in generate_moves(position, turn, player_color)
+                 if promoting & 1 << move.start and (move.end < 4 if turn is player_color else move.end >= 28))
+
+    for move in moves:
+        undo = move_piece(position, move, player_color)
+        value = -quiescence(position, not turn, ply + 1, player_color, -beta, -alpha, state)
+        unmake_move(position, undo)
+        if best_value is None or value > best_value:
+            best_value = value
+        if value > alpha:
+            alpha = value
+        if alpha >= beta:
+            break
+
+    return best_value
+
+
+def table_pv(position, turn, player_color, table, length):
+    """Follows the best moves stored in the transposition table from a position, returns them as (start, end) pairs
+    length: The most moves to follow
+    """
+    pv = []
+    first_undo = None
+    while len(pv) < length:
+        entry = table.probe(position.hash, count=False)
+        if entry is None or entry[3] is None:
+            break
+        # The stored move could be from a different position with the same index, so it has to actually be legal here
+        move = next((move for move in find_moves(position, turn, player_color)
+                     if (move.start, move.end) == entry[3]), None)
+        if move is None:
+            break
+        undo = move_piece(position, move, player_color)
+        if first_undo is None:
+            first_undo = undo
+        pv.append(entry[3])
+        turn = not turn
+    # Each undo holds the whole position from before the move, so going back to the first one is enough
+    if first_undo is not None:
+        unmake_move(position, first_undo)
+    return pv
+
+
+def negamax(position, turn, depth, search_depth, player_color, alpha, beta, state):
+    """Alpha-beta search, scores are from the perspective of the side whose turn it is (+ = side to move is winning)
+    The result is exact if it lies between alpha and beta, otherwise it is only a bound
+    """
+    state.pv_table[depth] = []
+    # Past the search depth, only captures and promotions are looked at
+    if depth >= search_depth:
+        return quiescence(position, turn, 0, player_color, alpha, beta, state)
+
+    state.nodes += 1
+    # Checking the clock is slow compared to searching a node, so only do it every so often
+    if state.nodes & 1023 == 0 and state.out_of_time():
+        raise SearchTimeout
+
+    # With few enough pieces left, the tablebase knows the result for sure
+    if state.tablebase.max_pieces:
+        score = state.tablebase.probe(position)
+        if score is not None:
+            state.tablebase_hits += 1
+            return score
+
+    moves = find_moves(position, turn, player_color)
+    # If there are no more possible moves, the side whose turn it is has lost
+    if not moves:
+        return -1_000_000
+
+    # See if this position has already been searched, possibly through a different order of moves
+    key = position.hash
+    remaining_depth = search_depth - depth
+    entry = state.table.probe(key)
+    best_move = None
+    if entry is not None:
+        entry_depth, bound, entry_score, best_move = entry
+        if entry_depth >= remaining_depth:
+            if bound == EXACT:
+                # An exact score can end up on the principal variation, which would otherwise stop here, leaving
+                # nothing to order the next iteration by or to ponder on
+                state.pv_table[depth] = table_pv(position, turn, player_color, state.table, remaining_depth)
+                return entry_score
+            if bound == LOWER and entry_score >= beta or bound == UPPER and entry_score <= alpha:
+                return entry_score
+    original_alpha = alpha
+
+    # While still on the previous iteration's principal variation, its move goes first
+    if state.follow_pv:
+        if depth - 1 < len(state.pv):
+            best_move = state.pv[depth - 1]
+        else:
+            state.follow_pv = False
+
+    best_value = None
+    for move in order_moves(moves, position, depth, player_color, state, best_move):
+        undo = move_piece(position, move, player_color)
+        value = -negamax(position, not turn, depth + 1, search_depth, player_color, -beta, -alpha, state)
+        unmake_move(position, undo)
+        # Only the first move searched can be on the principal variation
+        state.follow_pv = False
+
+        if best_value is None or value > best_value:
+            best_value = value
+            best_move = (move.start, move.end)
+        if value > alpha:
+            alpha = value
+            state.pv_table[depth] = [best_move] + state.pv_table.get(depth + 1, [])
+        if alpha >= beta:
+            # The opponent won't allow this position, so the rest of the moves don't need to be looked at
+            # Remember quiet moves that cause cutoffs, they are likely to be good in similar positions
+            if not move.captured:
+                killers = state.killers.setdefault(depth, [])
+                if (move.start, move.end) not in killers:
+                    killers.insert(0, (move.start, move.end))
+                    del killers[2:]
+                state.history[move.start * 32 + move.end] += max(remaining_depth, 1) ** 2
+            break
+
+    if best_value <= original_alpha:
+        bound = UPPER
+    elif best_value >= beta:
+        bound = LOWER
+    else:
+        bound = EXACT
+    state.table.store(key, remaining_depth, bound, best_value, best_move)
+
+    return best_value
+
+
+def minimax(position, turn, depth, search_depth, player_color, state=None):
+    """Finds the score of a position from the player's perspective, used by search_root() for each move"""
+    if state is None:
+        state = SearchState()
+    score = negamax(position, turn, depth, search_depth, player_color, -float("inf"), float("inf"), state)
+    if turn is player_color:
+        return score
+    return -score
+
+
+def search_root(position, worker_id, deadline, max_depth, table, stop_event=None, weights=None, progress=None,
+                tablebase=None):
+    """Iterative deepening over all the possible moves from a position, for the side whose turn it is
+    worker_id: When several processes search the same position at once, worker 0 is the main one
+    The other workers start on a different move and odd numbered workers search one ply deeper,
+    so they fill the shared transposition table with results that the rest will need soon
+    deadline: time.time() after which the search gives up, the first iteration always runs to the end
+    (setting stop_event doesn't stop it either, so there's always a move to play)
+    max_depth: Deepest iteration that is started
+    table: TranspositionTable to use, stop_event, weights and tablebase: see SearchState
+    progress: Called with (worker_id, depth, move number, score, nodes searched so far) every time a move has
+    been searched, to show how the search is going while it runs
+    Returns (depth of the last finished iteration, [score for each move], [principal variation for each move],
+    nodes searched, stats), scores are from the player's perspective
+    stats: The transposition table counters (see TranspositionTable), the counters of SearchState,
+    "iteration_nodes": [nodes searched by the end of each finished iteration],
+    "move_nodes" and "move_times": [nodes searched, seconds spent, for each move over all the iterations]
+    The whole search makes and takes back moves on the position given, which is put back the way it was at the end
+    """
+    table.hits = table.misses = table.collisions = 0
+    # A timeout leaves moves made all the way down the tree, but the undo information has everything that
+    # changes, so taking back the root's state is enough to put the position back
+    root_undo = (position.red, position.black, position.kings, position.turn, position.hash, position.score)
+    root_table = position.table
+    if weights is not None:
+        position.use_table(weights)
+    turn = position.turn
+    player_color = position.player_color
+    moves = find_moves(position, turn, player_color)
+
+    state = SearchState(table, weights=weights, tablebase=tablebase)
+    order = list(range(len(moves)))
+    if moves:
+        order = order[worker_id % len(moves):] + order[:worker_id % len(moves)]
+    scores = [None] * len(moves)
+    pvs = [()] * len(moves)
+    completed_depth = 0
+    iteration_nodes = []
+    move_nodes = [0] * len(moves)
+    move_times = [0.0] * len(moves)
+    try:
+        for search_depth in range(1 + worker_id % 2, max_depth + 1):
+            if search_depth > 1:
+                state.deadline = deadline
+                state.stop_event = stop_event
+            state.search_depth = search_depth
+            new_scores = [None] * len(moves)
+            for num in order:
+                undo = move_piece(position, moves[num], player_color)
+                state.pv = list(pvs[num])
+                state.follow_pv = bool(state.pv)
+                start_nodes, start_time = state.nodes, time.perf_counter()
+                try:
+                    new_scores[num] = minimax(position, not turn, 1, search_depth, player_color, state)
+                finally:
+                    # Counted even if the search runs out of time in the middle of the move
+                    move_nodes[num] += state.nodes - start_nodes
+                    move_times[num] += time.perf_counter() - start_time
+                pvs[num] = state.pv_table[1]
+                unmake_move(position, undo)
+                if progress is not None:
+                    progress(worker_id, search_depth, num, new_scores[num], state.nodes)
+            scores = new_scores
+            completed_depth = search_depth
+            iteration_nodes.append(state.nodes)
+
+            # If there's only one possible move, there's nothing to decide, but it's still worth searching deep
+            # enough to know the likely reply, for pondering and for the next search to start from
+            if len(moves) == 1 and pvs[0]:
+                break
+    except SearchTimeout:
+        pass
+    finally:
+        unmake_move(position, root_undo)
+        position.table = root_table
+
+    stats = table.stats()
+    stats.update(evaluations=state.evaluations, quiescence_nodes=state.quiescence_nodes,
+                 quiescence_limit=state.quiescence_limit, tablebase_hits=state.tablebase_hits,
+                 max_depth=state.max_depth, iteration_nodes=iteration_nodes, move_nodes=move_nodes,
+                 move_times=move_times)
+    return completed_depth, scores, pvs, state.nodes, stats
+
+
+# Set up in each worker process by init_worker(): the transposition table shared by all the workers,
+# the event the main process sets to make the workers stop searching, the queue the workers report their progress
+# on, and the board every search runs on
+_worker_table = None
+_worker_stop_event = None
+_worker_progress_queue = None
+_worker_position = None
+# Used by best_move() when it searches without a pool, kept between searches like the workers' table
+_local_table = None
+# Counts the searches, so the transposition tables can tell results of the current search from older ones
+_search_generation = 0
+
+
+def init_worker(table_buffer, table_size_mb, replacement, stop_event, progress_queue):
+    """Runs once when each worker process of a SearchPool starts"""
+    global _worker_table, _worker_stop_event, _worker_progress_queue, _worker_position
+    _worker_table = TranspositionTable(table_size_mb, replacement, table_buffer)
+    _worker_stop_event = stop_event
+    _worker_progress_queue = progress_queue
+    _worker_position = Position()
+
+
+def worker_search_root(packed_position, worker_id, deadline, max_depth, generation, weights=None):
+    """Runs in a worker process of a SearchPool: search_root() with the shared transposition table
+    packed_position: The position from Position.pack()
+    generation: Which search this is, see TranspositionTable
+    """
+    _worker_table.generation = generation % 64
+    _worker_position.load(packed_position)
+
+    def progress(*report):
+        # Tagged with the search it's from, so reports that arrive late aren't mistaken for the next search's
+        _worker_progress_queue.put((generation,) + report)
+
+    return search_root(_worker_position, worker_id, deadline, max_depth, _worker_table, _worker_stop_event, weights,
+                       progress)
+
+
+class SearchPool:
+    def __init__(self, workers=WORKERS, table_size_mb=TT_SIZE_MB, replacement=TT_REPLACEMENT):
+        """Worker processes that search for the computer together (Lazy SMP), kept for as long as they're needed
+        workers: Number of processes, None for one per CPU
+        The workers all search the same position, sharing one transposition table kept in shared memory,
+        so whatever one of them finds, the others don't have to search again
+        """
+
+        self.workers = workers if workers is not None else os.cpu_count()
+        self.table_buffer = multiprocessing.RawArray(ctypes.c_ubyte, TranspositionTable.buffer_size(table_size_mb))
+        self.stop_event = multiprocessing.Event()
+        self.progress_queue = multiprocessing.Queue()
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers, initializer=init_worker,
+            initargs=(self.table_buffer, table_size_mb, replacement, self.stop_event, self.progress_queue))
+
+    def search(self, position, deadline, max_depth, generation, weights=None, progress=None):
+        """Runs search_root() in every worker at once, returns the list of their results
+        progress: Called with the workers' progress reports while they search, see search_root()
+        """
+        # A stop that came in after the last search was over was meant for that one
+        self.stop_event.clear()
+        # The position is sent to the workers packed into a single int, which is much cheaper to pickle
+        processes = []
+        for worker_id in range(self.workers):
+            process = self.executor.submit(worker_search_root, position.pack(), worker_id, deadline, max_depth,
+                                           generation, weights)
+            processes.append(process)
+        # Pass the progress reports on until the main worker is done, the queue is emptied either way
+        while True:
+            try:
+                report = self.progress_queue.get(timeout=0.05)
+            except queue.Empty:
+                if processes[0].done():
+                    break
+                continue
+            if progress is not None and report[0] == generation:
+                progress(*report[1:])
+        # Once the main worker is done, the helpers have nothing left to help with
+        results = [processes[0].result()]
+        self.stop_event.set()
+        results += [process.result() for process in processes[1:]]
+        self.stop_event.clear()
+        return results
+
+    def stop(self):
+        """Makes the workers stop searching and return what they have found so far, can be called from another
+        thread while search() is running
+        """
+        self.stop_event.set()
+
+    def shutdown(self):
+        self.stop_event.set()
+        self.executor.shutdown()
+
+
+class Limits:
+    def __init__(self, time_budget=TIME_BUDGET, max_depth=MAX_SEARCH_DEPTH, weights=None, use_book=True):
+        """How much the computer may search for one move, and how it scores positions
+        time_budget: Seconds, once they have passed the current iteration is abandoned, None for no limit
+        max_depth: Deepest iteration that is started
+        weights: Weight table for evaluate() (see weight_table() and load_weights()), DEFAULT_TABLE if not given
+        use_book: Whether to play a move from the opening book (default_book()) without searching if there is one
+        """
+
+        self.time_budget = time_budget
+        self.max_depth = max_depth
+        self.weights = weights
+        self.use_book = use_book
+
+
+class SearchResult:
+    def __init__(self, move, moves_scored, depth, nodes, search_time, table_stats, book=False, pv=(), stats=None):
+        """What best_move() found
+        move: The chosen Move, None if there are no possible moves
+        moves_scored: [[move, score], ...] for every possible move, scores are from the player's perspective
+        (+ = player is winning) and rounded to 2 decimal places
+        depth: Depth of the last iteration that was finished for every move
+        nodes: Positions searched, by all the workers together
+        search_time: Seconds the search took
+        table_stats: Transposition table counters, see TranspositionTable
+        book: Whether the move came from the opening book, then nothing was searched and moves_scored is empty
+        pv: Principal variation [(start, end), ...] expected to follow the chosen move, starting with the
+        opponent's reply, empty if it isn't known
+        stats: What the search did, empty for a book move: the counters of SearchState added up over the workers
+        (max_depth is the deepest of any worker), depth, nodes, time, the transposition table counters,
+        "table_hit_rate": hits out of all the lookups, "branching_factor": how many times more nodes the last
+        iteration took than the one before (None if unknown), "move_nodes" and "move_times": [nodes searched,
+        seconds spent, for each move in moves_scored, by all the workers together]
+        """
+
+        self.move = move
+        self.moves_scored = moves_scored
+        self.depth = depth
+        self.nodes = nodes
+        self.search_time = search_time
+        self.table_stats = table_stats
+        self.book = book
+        self.pv = list(pv)
+        self.stats = stats if stats is not None else {}
+
+
+class SearchProgress:
+    def __init__(self, position):
+        """Keeps track of the progress reports of a search while it runs, pass its update() to best_move()
+        moves: The possible moves, in the order the reports number them
+        depth: Deepest iteration that a worker has finished for every move, 0 until the first one is done
+        scores: [score for each move] from that iteration, None until the first one is done
+        move_scores: [(depth, score) for each move] from the deepest search of each move so far, None for moves
+        that haven't been searched yet, these come in one at a time as the moves are searched
+        nodes: Positions searched so far, by all the workers together
+        """
+
+        self.moves = legal_moves(position)
+        self.depth = 0
+        self.scores = None
+        self.move_scores = [None] * len(self.moves)
+        self.nodes = 0
+        # The side whose turn it is wants the highest score times this
+        self.sign = 1 if position.turn is position.player_color else -1
+        self.worker_nodes = {}
+        # {(worker_id, depth): [score or None for each move]}
+        self.iterations = {}
+
+    def update(self, worker_id, depth, num, score, nodes):
+        """Takes in one progress report, see search_root()"""
+        self.worker_nodes[worker_id] = nodes
+        self.nodes = sum(self.worker_nodes.values())
+        scores = self.iterations.setdefault((worker_id, depth), [None] * len(self.moves))
+        scores[num] = score
+        if self.move_scores[num] is None or depth >= self.move_scores[num][0]:
+            self.move_scores[num] = (depth, score)
+        if depth > self.depth and None not in scores:
+            self.depth = depth
+            self.scores = scores
+
+    def best(self):
+        """(move, score) that's best so far, None until the first iteration is done"""
+        if self.scores is None:
+            return None
+        return max(zip(self.moves, self.scores), key=lambda move_score: self.sign * move_score[1])
+
+
+def new_game(player_color=True):
+    """The starting position, player_color is the color at the bottom of the board, black moves first"""
+    top = 0xfff  # Rows 1 to 3
+    bottom = 0xfff << 20  # Rows 6 to 8
+    if player_color is True:
+        return Position(red=top, black=bottom, turn=True, player_color=True)
+    return Position(red=bottom, black=top, turn=True, player_color=False)
+
+
+def legal_moves(position):
+    """All the possible moves [Move, ...] for the side whose turn it is"""
+    return find_moves(position, position.turn, position.player_color)
+
+
+def apply(position, move):
+    """Returns the position after a move from legal_moves(), the position given isn't changed"""
+    new_position = position.copy()
+    move_piece(new_position, move, new_position.player_color)
+    return new_position
+
+
+def perft(position, depth):
+    """Counts the positions reached after exactly depth plies (positions with no moves before that aren't counted)
+    The position is changed while counting but is put back the way it was at the end
+    """
+    if depth == 0:
+        return 1
+    moves = find_moves(position, position.turn, position.player_color)
+    if depth == 1:
+        return len(moves)
+    total = 0
+    for move in moves:
+        undo = move_piece(position, move, position.player_color)
+        total += perft(position, depth - 1)
+        unmake_move(position, undo)
+    return total
+
+
+def best_move(position, limits=None, pool=None, table=None, progress=None, stop_event=None):
+    """Searches for the best move for the side whose turn it is, returns a SearchResult
+    limits: Limits of the search, the defaults if not given
+    pool: SearchPool to search with, otherwise the search runs in this process
+    table: TranspositionTable for searching in this process, one kept between calls is used if not given
+    Searches with different weights need different tables, since the stored scores depend on them
+    progress: Called with progress reports while searching, see search_root() and SearchProgress
+    stop_event: threading.Event that stops a search in this process early once it is set, the best move found so
+    far is still returned (a pool is stopped with SearchPool.stop() instead)
+    """
+    global _local_table, _search_generation
+    if limits is None:
+        limits = Limits()
+    search_start = time.time()
+
+    if limits.use_book:
+        move = default_book().choose(position)
+        if move is not None:
+            logger.info("book move")
+            return SearchResult(move, [], 0, 0, time.time() - search_start,
+                                {"hits": 0, "misses": 0, "collisions": 0}, book=True)
+
+    _search_generation += 1
+    deadline = None
+    if limits.time_budget is not None:
+        deadline = search_start + limits.time_budget
+
+    if pool is not None:
+        results = pool.search(position, deadline, limits.max_depth, _search_generation, limits.weights, progress)
+    else:
+        if table is None:
+            if _local_table is None:
+                _local_table = TranspositionTable()
+            table = _local_table
+        table.generation = _search_generation % 64
+        results = [search_root(position, 0, deadline, limits.max_depth, table, stop_event, limits.weights, progress)]
+    search_time = time.time() - search_start
+
+    # The scores that are used are from the deepest iteration that any worker finished for every move
+    completed_depth, scores, pvs, iteration_nodes = 0, None, None, []
+    nodes = 0
+    table_stats = {"hits": 0, "misses": 0, "collisions": 0}
+    moves = legal_moves(position)
+    stats = {"evaluations": 0, "quiescence_nodes": 0, "quiescence_limit": 0, "tablebase_hits": 0, "max_depth": 0,
+             "move_nodes": [0] * len(moves), "move_times": [0.0] * len(moves)}
+    for worker_depth, worker_scores, worker_pvs, worker_nodes, worker_stats in results:
+        if worker_depth > completed_depth:
+            completed_depth, scores, pvs = worker_depth, worker_scores, worker_pvs
+            iteration_nodes = worker_stats["iteration_nodes"]
+        nodes += worker_nodes
+        for counter in table_stats:
+            table_stats[counter] += worker_stats[counter]
+        for counter in ("evaluations", "quiescence_nodes", "quiescence_limit", "tablebase_hits"):
+            stats[counter] += worker_stats[counter]
+        stats["max_depth"] = max(stats["max_depth"], worker_stats["max_depth"])
+        for num in range(len(moves)):
+            stats["move_nodes"][num] += worker_stats["move_nodes"][num]
+            stats["move_times"][num] += worker_stats["move_times"][num]
+
+    # Effective branching factor: how many times more nodes the last finished iteration took than the one before
+    per_iteration = [end - start for start, end in zip([0] + iteration_nodes, iteration_nodes)]
+    branching_factor = None
+    if len(per_iteration) >= 2 and per_iteration[-2]:
+        branching_factor = per_iteration[-1] / per_iteration[-2]
+    lookups = table_stats["hits"] + table_stats["misses"]
+    stats.update(table_stats, depth=completed_depth, nodes=nodes, time=search_time,
+                 branching_factor=branching_factor, table_hit_rate=table_stats["hits"] / lookups if lookups else None)
+
+    # Round numbers to 2 decimal places to get rid of binary rounding error
+    moves_scored = [[move, round(score, 2)] for move, score in zip(moves, scores or [])]
+
+    # Pick out the move(s) with the best score for the side whose turn it is (the player is trying to make the score
+    # as high as possible, the other side as low as possible), and pick a random move from the move(s)
+    chosen = None
+    pv = ()
+    if moves_scored:
+        sign = 1 if position.turn is position.player_color else -1
+        best_score = max(sign * score for _, score in moves_scored)
+        best_moves = [move for move, score in moves_scored if sign * score == best_score]
+        chosen = best_moves[random.randrange(0, len(best_moves))]
+        pv = pvs[moves.index(chosen)]
+
+    logger.info("searched %d plies deep, %d nodes in %.2f s (%d nodes/s with %d workers)",
+                completed_depth, nodes, search_time, nodes / max(search_time, 1e-9),
+                pool.workers if pool is not None else 1)
+    logger.info("transposition table: %(hits)d hits, %(misses)d misses, %(collisions)d collisions", table_stats)
+    # The whole of stats goes on the log record too (record.search_stats), for a handler that collects them
+    logger.info("%(evaluations)d evaluations, %(quiescence_nodes)d quiescence nodes (%(quiescence_limit)d stopped "
+                "at the limit), %(max_depth)d plies deep at most", stats, extra={"search_stats": stats})
+    return SearchResult(chosen, moves_scored, completed_depth, nodes, search_time, table_stats, pv=pv, stats=stats)
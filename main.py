@@ -1,6 +1,13 @@
-import graphics as gr
-import random
 import concurrent.futures
+import time
+
+import graphics as gr
+import engine
+
+# Key that makes the computer stop thinking and play the best move it has found so far
+STOP_KEY = "space"
+# How deep the quick search goes that guesses the player's move, when the computer has no better guess
+PONDER_GUESS_DEPTH = 4
 
 
 def initialize_board(player_color, squares, game_board):
@@ -21,7 +28,7 @@ def initialize_board(player_color, squares, game_board):
         column.draw(game_board)
 
     # Text that says "Debug"
-    debug_heading = gr.Text(gr.Point(575, 25), "Debug")
+    debug_heading = gr.Text(gr.Point(610, 25), "Debug")
     debug_heading.setSize(18)
     debug_heading.setStyle("bold")
     debug_heading.draw(game_board)
@@ -45,73 +52,6 @@ def initialize_board(player_color, squares, game_board):
     divider = gr.Line(gr.Point(500, 0), gr.Point(500, 500))
     divider.draw(game_board)
 
-    # This code will generate the connections between the squares on the board
-    # This can be done manually, but it's arguably more interesting to do it algorithmically
-
-    # connections_dict is nested dictionary with {square <tuple>: {connection type <int>: connected square <tuple>}}
-    # Squares and connected squares are tuples specified with row and pos (position in row), (row, pos): 1 to 8, 1 to 4
-    # Connection type ranges from 0 to 3: top right, bottom right, bottom left, top left: from perspective of self
-    connections_dict = {}
-    # Give an index for each square
-    for row in range(1, 9):
-        for position_in_row in range(1, 5):
-            connections_dict[(row, position_in_row)] = {}
-
-    # There are 8 types of squares: Those on each of the 4 edges,
-    # upper right and lower left corners, and the middle ones on even and odd rows
-
-    for square in connections_dict:
-        row = square[0]
-        pos = square[1]  # Position in row
-        # Upper edge squares (excluding top right)
-        if row == 1 and pos in (1, 2, 3):
-            connections_dict[square] = {0: None,
-                                        1: (row + 1, pos + 1),
-                                        2: (row + 1, pos),
-                                        3: None}
-        # Top right square
-        if row == 1 and pos == 4:
-            connections_dict[square] = {0: None,
-                                        1: None,
-                                        2: (row + 1, pos),
-                                        3: None}
-        # Left edge excluding bottom left
-        if row in (2, 4, 6) and pos == 1:
-            connections_dict[square] = {0: (row - 1, pos),
-                                        1: (row + 1, pos),
-                                        2: None,
-                                        3: None}
-        # Center squares on even rows
-        if row in (2, 4, 6) and pos in (2, 3, 4):
-            connections_dict[square] = {0: (row - 1, pos),
-                                        1: (row + 1, pos),
-                                        2: (row + 1, pos - 1),
-                                        3: (row - 1, pos - 1)}
-        # Center squares on odd rows
-        if row in (3, 5, 7) and pos in (1, 2, 3):
-            connections_dict[square] = {0: (row - 1, pos + 1),
-                                        1: (row + 1, pos + 1),
-                                        2: (row + 1, pos),
-                                        3: (row - 1, pos)}
-        # Right edge
-        if row in (3, 5, 7) and pos == 4:
-            connections_dict[square] = {0: None,
-                                        1: None,
-                                        2: (row + 1, pos),
-                                        3: (row - 1, pos)}
-        # Bottom left square
-        if row == 8 and pos == 1:
-            connections_dict[square] = {0: (row - 1, pos),
-                                        1: None,
-                                        2: None,
-                                        3: None}
-        # Bottom row
-        if row == 8 and pos in (2, 3, 4):
-            connections_dict[square] = {0: (row - 1, pos),
-                                        1: None,
-                                        2: None,
-                                        3: (row - 1, pos - 1)}
-
     pieces = []
     # If the player is playing red
     if player_color is False:
@@ -145,11 +85,19 @@ def initialize_board(player_color, squares, game_board):
     # Initialize the squares, the squares are drawn in Square.__init__() since the square background never changes
     for square_row in range(1, 9):
         for square_pos in range(1, 5):
-            square = Square(square_row, square_pos, connections_dict[(square_row, square_pos)],
-                            pieces[square_row * 4 - 5 + square_pos], real=True, game_board=game_board)
+            square = Square(square_row, square_pos, pieces[square_row * 4 - 5 + square_pos], real=True,
+                            game_board=game_board)
             squares[square_row - 1].append(square)
 
 
+def piece_center(row, pos):
+    """Coordinates of the center of a piece on a square (row and pos like Piece)"""
+    if row % 2 == 1:  # If piece is on rows 1, 3, 5, 7
+        return pos * 100 + 25, row * 50 + 25
+    # If piece is on rows 2, 4, 6, 8
+    return pos * 100 - 25, row * 50 + 25
+
+
 class Piece:
     def __init__(self, color, row, pos, king=False, highlight=False, real=False, game_board=None):
         """color: False = red, True = Black
@@ -174,10 +122,7 @@ class Piece:
             # Initialize the templates for the three parts of a piece:
             # the piece itself, and symbols for king or highlighted
 
-            if self.row % 2 == 1:  # If piece is on rows 1, 3, 5, 7
-                piece_position = gr.Point(self.pos * 100 + 25, self.row * 50 + 25)
-            else:  # If piece is on rows 2, 4, 6, 8
-                piece_position = gr.Point(self.pos * 100 - 25, self.row * 50 + 25)
+            piece_position = gr.Point(*piece_center(self.row, self.pos))
             self.piece_template = (gr.Circle(piece_position, 20))
 
             self.king_template = gr.Text(piece_position, "K")
@@ -189,63 +134,59 @@ class Piece:
             self.highlight_template.setWidth(4)
             self.highlight_template.setOutline("gold")
 
-    def draw_piece(self):
-        # Updates the templates for the three parts of a piece: the piece itself, and symbols for king or highlighted
+            if self.color is False:
+                self.piece_template.setFill("red4")
+                self.piece_template.setOutline("red4")
+            elif self.color is True:
+                self.piece_template.setFill("Black")
 
-        self.piece_template.undraw()
-        self.king_template.undraw()
-        self.highlight_template.undraw()
-
-        if self.row % 2 == 1:  # If piece is on rows 1, 3, 5, 7
-            piece_position = gr.Point(self.pos * 100 + 25, self.row * 50 + 25)
-        else:  # If piece is on rows 2, 4, 6, 8
-            piece_position = gr.Point(self.pos * 100 - 25, self.row * 50 + 25)
-        self.piece_template = (gr.Circle(piece_position, 20))
-
-        self.king_template = gr.Text(piece_position, "K")
-        self.king_template.setTextColor("gold")
-        self.king_template.setSize(27)
-        self.king_template.setStyle("bold")
+        # What's drawn on the board right now, so draw_piece() only has to change what's different
+        self.drawn = False
+        self.king_drawn = False
+        self.highlight_drawn = False
 
-        self.highlight_template = gr.Circle(piece_position, 22)
-        self.highlight_template.setWidth(4)
-        self.highlight_template.setOutline("gold")
+    def draw_piece(self):
+        # Brings the drawing of the three parts of a piece up to date: the piece itself, and symbols for king or
+        # highlighted, the graphics objects are made once and only drawn or undrawn when something changed
 
-        # Converts piece attributes into graphics.py objects and draws them
+        if not self.drawn:
+            self.piece_template.draw(self.game_board)
+            self.drawn = True
 
-        if self.color is False:
-            self.piece_template.setFill("red4")
-            self.piece_template.setOutline("red4")
-        elif self.color is True:
-            self.piece_template.setFill("Black")
-        self.piece_template.undraw()
-        self.piece_template.draw(self.game_board)
-
-        if self.king:
-            self.king_template.undraw()
+        if self.king and not self.king_drawn:
             self.king_template.draw(self.game_board)
-        if not self.king:
+        elif not self.king and self.king_drawn:
             self.king_template.undraw()
+        self.king_drawn = self.king
 
-        if self.highlight:
-            self.highlight_template.undraw()
+        if self.highlight and not self.highlight_drawn:
             self.highlight_template.draw(self.game_board)
-        if not self.highlight:
+        elif not self.highlight and self.highlight_drawn:
             self.highlight_template.undraw()
+        self.highlight_drawn = self.highlight
 
     def undraw_piece(self):
         self.piece_template.undraw()
         self.king_template.undraw()
         self.highlight_template.undraw()
+        self.drawn = self.king_drawn = self.highlight_drawn = False
+
+    def move_to(self, row, pos):
+        # Moves the piece to another square, a real piece's graphics objects are moved along with it
+        # (also on the screen, if they're drawn) instead of being made again
+        if self.real:
+            old_x, old_y = piece_center(self.row, self.pos)
+            new_x, new_y = piece_center(row, pos)
+            for template in (self.piece_template, self.king_template, self.highlight_template):
+                template.move(new_x - old_x, new_y - old_y)
+        self.row = row
+        self.pos = pos
 
 
 class Square:
-    def __init__(self, row, pos, connections, piece, highlight=False, real=False, game_board=None):
+    def __init__(self, row, pos, piece, highlight=False, real=False, game_board=None):
         """row, pos: specify position of square (same convention as position of piece)
         highlight: If square is highlighted, this is used when a piece is clicked, to show possible moves
-        connections: Dictionary with {connection type <int>: connected square <tuple>}
-        connected squares are tuples specified with row and pos (position in row); (row, pos): 1 to 8, 1 to 4
-        Connection type ranges from 0 to 3: top right, bottom right, bottom left, top left: from perspective of self
         piece: Which piece currently occupies this square
         real: Whether the square is part of the real game board, or is just in the computer's projections
         game_board: Which board (gr.GraphWin) the square belongs to
@@ -253,10 +194,10 @@ class Square:
 
         self.row = row
         self.pos = pos
-        self.connections = connections
         self.piece = piece
         self.game_board = game_board
         self.highlight = highlight
+        self.real = real
 
         # Only generate the graphics objects if the square is real, otherwise unnecessary and takes up too much memory
         if real:
@@ -275,14 +216,29 @@ class Square:
             self.highlight_template.setWidth(6)
             self.highlight_template.setOutline("gold")
 
+        # Whether the highlight is drawn on the board right now
+        self.highlight_drawn = False
+
     def draw_square(self):
-        # Need to draw highlight on square (if there is one)
+        # Need to draw highlight on square (if there is one), only if that has changed since it was last drawn
 
-        if self.highlight:
-            self.highlight_template.undraw()
+        if self.highlight and not self.highlight_drawn:
             self.highlight_template.draw(self.game_board)
-        else:
+        elif not self.highlight and self.highlight_drawn:
             self.highlight_template.undraw()
+        self.highlight_drawn = self.highlight
+
+
+def redraw(squares, game_board):
+    """Updates the drawing of everything that changed since the last time, and shows it all at once
+    Squares and pieces that haven't changed aren't touched, so this is cheap to call after every click
+    """
+    for row in squares:
+        for square in row:
+            square.draw_square()
+            if square.piece is not None:
+                square.piece.draw_piece()
+    game_board.update()
 
 
 def click_get_square(point):
@@ -315,224 +271,53 @@ def click_get_square(point):
     return row, int(pos)
 
 
-# I guess this function is kind of like deepcopy, but I couldn't figure out how to make deepcopy work
-def duplicate(squares_list):
-    new_squares = [[None, None, None, None],
-                   [None, None, None, None],
-                   [None, None, None, None],
-                   [None, None, None, None],
-                   [None, None, None, None],
-                   [None, None, None, None],
-                   [None, None, None, None],
-                   [None, None, None, None]]
-    for i, row in enumerate(squares_list):
-        for j, square in enumerate(row):
-            if square.piece is not None:
-                new_piece = Piece(square.piece.color, square.piece.row, square.piece.pos,
-                                  square.piece.king)
-                new_squares[i][j] = Square(square.row, square.pos, square.connections,
-                                           new_piece)
-            else:
-                new_squares[i][j] = Square(square.row, square.pos, square.connections,
-                                           None)
-    return new_squares
-
-
-def move_piece(old_square, new_square, captured, squares_list, player_color):
-    """Move a piece from the old square to the new square"""
-    # Figure out which squares in squares_list are representative of the squares to be moved
-    # This means find squares which aren't necessarily the same object, but have the same attributes (row and position)
-    captured_copy = []
-    for row in squares_list:
-        for square in row:
-            if square.row == old_square.row and square.pos == old_square.pos:
-                old_square = square
-                continue
-            if square.row == new_square.row and square.pos == new_square.pos:
-                new_square = square
-                continue
-            if captured != [None]:
-                for captured_square in captured:
-                    if square.row == captured_square.row and square.pos == captured_square.pos:
-                        captured_copy.append(square)
-                        continue
-
-    if captured_copy is not None:
-        for captured_square in captured_copy:
-            if captured_square is not None:
-                if captured_square.piece is not None:
-                    if captured_square.piece.real:
-                        captured_square.piece.undraw_piece()
-                    captured_square.piece = None
-
-    new_square.piece = old_square.piece
-    new_square.piece.row = new_square.row
-    new_square.piece.pos = new_square.pos
-
-    old_square.piece = None
-
-    # Check to make the piece king if necessary
-    # If piece is computer's
-    if new_square.piece.color is not player_color:
-        if new_square.row == 8:
-            new_square.piece.king = True
-    # If piece is player's
-    if new_square.piece.color is player_color:
-        if new_square.row == 1:
-            new_square.piece.king = True
-
-
-def find_moves(squares_list, side, player_color):
-    """Finds all the possible moves for a certain side (red or black), from a certain board position (squares_list)"""
-    # Figure out if there are any force jumps, and what they are
-    force_jumps = []
-    for row in squares_list:
+def squares_to_position(squares, turn, player_color):
+    """Makes an engine.Position out of a squares list (list of rows of Square)"""
+    red, black, kings = 0, 0, 0
+    for row in squares:
         for square in row:
             if square.piece is not None:
-                # Only need to check for available jumps for the color whose turn it is
-                if square.piece.color == side:
-                    for captured_list in search(square, squares_list, player_color).values():
-                        if captured_list != [None]:  # If there are possible captures for the piece on this square
-                            force_jumps.append(square)
-                            break
-
-    moves = []
-    if force_jumps:
-        for square in force_jumps:
-            moves.append([square, search(square, squares_list, player_color)])
-    else:
-        for row in squares_list:
-            for square in row:
-                if square.piece is not None:
-                    if square.piece.color == side:
-                        if search(square, squares_list, player_color) != {}:
-                            moves.append([square, search(square, squares_list, player_color)])
-
-    # Flatten the list of possible moves (so it's easier to work with)
-    moves_flat = []
-    for whole_move in moves:
-        start = whole_move[0]
-        end_and_captured = whole_move[1]
-        for end in end_and_captured:
-            captured = end_and_captured[end]
-            moves_flat.append([start, end, captured])
-
-    return moves_flat
-
-
-def search(start, squares_list, player_color):
-    """Finds all the possible moves for the piece on a certain square"""
-    # square_list is what game board it's going to search on
-
-    # start is which square <Square> to start the search from
-    # search() outputs dictionary {possible_move_1 <Square>: [captured pieces <Square>, ...], ...}
-
-    # Stores the possible moves as they're discovered: [{possible_move_1 <Square>: captured pieces <Square>}, ...]
-    moves = {}
-
-    # Make sure that if the piece isn't a king, that it doesn't jump backwards
-    # Only need to check this extra thing if the piece isn't a king
-    if start.piece.king is False:
-        # If the piece is at the top of the board
-        if start.piece.color is not player_color:
-            # Can only jump downwards (forwards from red's perspective)
-            allowed_jumps = [1, 2]
-        # If the piece is at the bottom of the board  # todo check all comments make sense with updated code
-        else:
-            # Can only jump upwards (forwards from black's perspective)
-            allowed_jumps = [0, 3]
-    else:
-        allowed_jumps = [0, 1, 2, 3]
-
-    # Search for all possible moves
-    # Loop through all the possible connections of the highlighted square ("start")
-    for connection_type in start.connections:
-        if connection_type in allowed_jumps:
-            connection = start.connections[connection_type]
-            if connection is not None:
-                connection_square = squares_list[connection[0] - 1][connection[1] - 1]
-                # If there is no piece on the connected square, it is a possible move
-                if connection_square.piece is None:
-                    moves.update({connection_square: [None]})
-                # if there is a piece, check if it's of the opposite color
-                elif connection_square.piece.color is not start.piece.color:
-                    # Reuse the previous connection direction, so it only tries to capture in a straight line
-                    other_side = connection_square.connections[connection_type]
-                    # If there is a square on the other side (not reached edge of board)
-                    if other_side is not None:
-                        other_side_square = squares_list[other_side[0] - 1][other_side[1] - 1]
-                        # And check if the square on the other side is empty, to be able to jump it
-                        if other_side_square.piece is None:
-
-                            # Figure out the rest of the possible jumps (similar to the main for loop, but only looking
-                            # for jumps, not regular moves)
-
-                            visited = []
-
-                            def find_all_jumps(start_from, previous_captured):
-                                end_reached_overall = True
-                                for connection_type in start_from.connections:
-                                    all_captured = previous_captured.copy()
-                                    end_reached = False
-                                    if connection_type in allowed_jumps:
-                                        new_connection = start_from.connections[connection_type]
-                                        if new_connection is not None:
-                                            new_connection_square = squares_list[new_connection[0] - 1] \
-                                                [new_connection[1] - 1]
-                                            if new_connection_square not in visited:
-                                                if new_connection_square.piece is not None:
-                                                    if new_connection_square.piece.color is not start.piece.color:
-                                                        new_other_side = new_connection_square.connections[
-                                                            connection_type]
-                                                        if new_other_side is not None:
-                                                            new_other_side_square = \
-                                                                squares_list[new_other_side[0] - 1] \
-                                                                    [new_other_side[1] - 1]
-                                                            if new_other_side_square.piece is None:
-                                                                all_captured.append(new_connection_square)
-                                                                visited.append(new_connection_square)
-                                                            else:
-                                                                end_reached = True
-                                                        else:
-                                                            end_reached = True
-                                                    else:
-                                                        end_reached = True
-                                                else:
-                                                    end_reached = True
-                                            else:
-                                                end_reached = True
-                                        else:
-                                            end_reached = True
-                                    else:
-                                        end_reached = True
-
-                                    if end_reached is False:
-                                        end_reached_overall = False
-                                        # Recursion if needed
-                                        find_all_jumps(new_other_side_square, all_captured)
-
-                                # If no more moves in each of the 4 directions
-                                if end_reached_overall:
-                                    moves.update({start_from: previous_captured})
-
-                            find_all_jumps(other_side_square, [connection_square])
-
-    # Implement the force jump rule for each piece,
-    # meaning that if a piece has available jumps, it must take one of them, rather than an ordinary move
-    jump_available = False
-    for any_captured in moves.values():
-        if any_captured != [None]:
-            jump_available = True
-            break
-    if jump_available:
-        for move in moves.copy():
-            if moves[move] == [None]:
-                moves.pop(move)
-
-    # todo Add ambiguous jump handling
+                bit = 1 << engine.square_index(square.row, square.pos)
+                if square.piece.color is False:
+                    red |= bit
+                else:
+                    black |= bit
+                if square.piece.king:
+                    kings |= bit
+    return engine.Position(red, black, kings, turn, player_color)
+
+
+def position_to_squares(position, squares):
+    """Updates the pieces of a squares list (list of rows of Square) to match an engine.Position
+    A piece that left its square is moved to a square of its color that got a piece, the pieces that are left over
+    are no longer on the board (captured) and are undrawn if they are real, new pieces are made real if the square is
+    """
+    # Pieces that left their square, by color
+    left = {False: [], True: []}
+    for row in squares:
+        for square in row:
+            color = position.color_at(engine.square_index(square.row, square.pos))
+            if square.piece is not None and (color is None or square.piece.color is not color):
+                left[square.piece.color].append(square.piece)
+                square.piece = None
 
-    # search() outputs dictionary {possible_move_1 <Square>: [captured pieces <Square>, ...], ...}
-    return moves
+    for row in squares:
+        for square in row:
+            index = engine.square_index(square.row, square.pos)
+            color = position.color_at(index)
+            if color is not None:
+                if square.piece is None and left[color]:
+                    square.piece = left[color].pop()
+                    square.piece.move_to(square.row, square.pos)
+                elif square.piece is None:
+                    square.piece = Piece(color, square.row, square.pos, real=square.real,
+                                         game_board=square.game_board)
+                square.piece.king = bool(position.kings & 1 << index)
+
+    for pieces in left.values():
+        for piece in pieces:
+            if piece.real:
+                piece.undraw_piece()
 
 
 def player_move(turn, squares, player_color, game_board):
@@ -544,16 +329,18 @@ def player_move(turn, squares, player_color, game_board):
     if click_square_coordinates is not None:
         # Read the connections associated with the square
         click_square_object = squares[click_square_coordinates[0] - 1][click_square_coordinates[1] - 1]
+        click_square_index = engine.square_index(*click_square_coordinates)
 
         # Find which moves are possible from the current position
-        allowed_moves = find_moves(squares, turn, player_color)
+        position = squares_to_position(squares, turn, player_color)
+        allowed_moves = engine.legal_moves(position)
         allowed_starts = []
         for move in allowed_moves:
-            allowed_starts.append(move[0])
+            allowed_starts.append(move.start)
 
         # If there are any squares with jumps available, they are the only allowed moves,
         # otherwise if no jumps available, all moves allowed
-        if click_square_object in allowed_starts:
+        if click_square_index in allowed_starts:
             allowed = True
         else:
             allowed = False
@@ -566,202 +353,186 @@ def player_move(turn, squares, player_color, game_board):
                     click_square_object.piece.highlight = True
 
                     # Highlight all the possible moves
-                    possible_moves = search(click_square_object, squares, player_color)
+                    # possible_moves = [engine.Move, ...]
+                    possible_moves = engine.search(click_square_index, position, player_color)
                     for move in possible_moves:
-                        move.highlight = True
+                        move_row, move_pos = engine.square_row_pos(move.end)
+                        squares[move_row - 1][move_pos - 1].highlight = True
 
                     # Update the drawing of everything in between mouse clicks
-                    for row in squares:
-                        for square in row:
-                            square.draw_square()
-                            if square.piece is not None:
-                                square.piece.draw_piece()
-                    game_board.update()
+                    redraw(squares, game_board)
 
                     # Detect whether / where to move the selected piece
                     second_click = game_board.getMouse()
                     second_click_square_coordinates = click_get_square(second_click)
                     if second_click_square_coordinates is not None:
-                        second_click_square_object = \
-                            squares[second_click_square_coordinates[0] - 1][second_click_square_coordinates[1] - 1]
-                        if second_click_square_object in possible_moves:
-                            move_piece(click_square_object, second_click_square_object,
-                                       possible_moves[second_click_square_object], squares, player_color)
+                        second_click_square_index = engine.square_index(*second_click_square_coordinates)
+                        chosen_moves = [move for move in possible_moves if move.end == second_click_square_index]
+
+                        # If the piece can get to that square by capturing different pieces (ambiguous jump),
+                        # highlight the pieces that make the difference and let the player click on the one
+                        # they want to capture, until there's only one way left
+                        while len(chosen_moves) > 1:
+                            all_captured = 0
+                            for move in chosen_moves:
+                                all_captured |= move.captured
+                            for captured_index in engine.mask_squares(all_captured):
+                                captured_row, captured_pos = engine.square_row_pos(captured_index)
+                                captured_piece = squares[captured_row - 1][captured_pos - 1].piece
+                                captured_piece.highlight = any(not move.captured & 1 << captured_index
+                                                               for move in chosen_moves)
+                                captured_piece.draw_piece()
+                            game_board.update()
+
+                            capture_click_square_coordinates = click_get_square(game_board.getMouse())
+                            if capture_click_square_coordinates is None:
+                                return
+                            capture_click_square_index = engine.square_index(*capture_click_square_coordinates)
+                            chosen_moves = [move for move in chosen_moves
+                                            if move.captured & 1 << capture_click_square_index]
+
+                        if chosen_moves:
+                            engine.move_piece(position, chosen_moves[0], player_color)
+                            position_to_squares(position, squares)
 
                             # Tell the program that the player has actually made a move
                             # (rather than clicked on illegal square)
                             return True
 
 
-def minimax(board, turn, depth, end_piece_moved, search_depth, player_color):
-    """Recursive algorithm to do minimax move evaluation, used in next function computer_move()"""
-    moves = find_moves(board, turn, player_color)
-
-    # If there are captures, these need to be looked at, even if the default search depth is exceeded
-    # Otherwise the results will be skewed since a capture may be detected, but not the recapture afterwards
-    capturing = False
-    for move in moves:
-        if move[2] != [None]:
-            capturing = True
-            break
-
-    # Check if reached end of branch (certain depth reached and no further captures
-    # and no pieces near the end-zone moves), or no more possible moves
-    if depth >= search_depth and not capturing and not end_piece_moved or moves == []:
-        # Analyze the current board situation to give it a score
-        # Looking for how many pieces each side has
-
-        # TODO Add endgame strategy algorithm
-        # TODO Add king chasing down opponent pieces and cornering opponent king feature
-
-        # TODO Add piece formation and overextension evaluation
-
-        # todo Change program into C++ to run faster
-
-        # TODO Add repetition escape feature if computer is winning
-        # TODO Add start using the king more if one side has a king and the other side doesn't
-
-        # TODO Add more advanced king detection, where there are no pieces blocking it, not just nearing end-zone
-
-        # TODO Use neural nets to play better
-
-        # If there are no more possible moves
-        if not moves:
-            # If it's the computer's turn, and it can't move
-            if turn is not player_color:
-                return 1_000_000
-            # If it's the player's turn, and they can't move
-            if turn is player_color:
-                return -1_000_000
-
-        # todo Adjust scoring scheme? More locations / different values
-        # Current scoring scheme:
-        # 1 for normal piece, 3 for king
-        # +0.1 if it's in the center 4x4
-        # an additional +0.05 on top of that if it's in the center 2x2
-
-        # +0.5 bonus if it's a normal piece, and it's on one of the two back row squares
-        # that control the whole back area
-        computer_pieces_score = 0
-        player_pieces_score = 0
-        for row in board:
-            for square in row:
-                if square.piece is not None:
-                    if square.piece.color is not player_color:
-                        # Check if piece is in center of board, slightly better position
-                        if square.piece.row in [3, 4, 5, 6] and square.piece.pos in [2, 3]:
-                            computer_pieces_score += 0.1
-                        if square.piece.row == 4 and square.piece.pos == 3 or \
-                                square.piece.row == 5 and square.piece.pos == 2:
-                            computer_pieces_score += 0.05
-
-                        if square.piece.king is True:
-                            computer_pieces_score += 3
-                        else:
-                            computer_pieces_score += 1
-                            # Check for the back row pieces
-                            if square.piece.row == 1 and square.piece.pos in [1, 3]:
-                                computer_pieces_score += 0.5
-
-                    if square.piece.color is player_color:
-                        # Check if piece is in center of board, slightly better position
-                        if square.piece.row in [3, 4, 5, 6] and square.piece.pos in [2, 3]:
-                            player_pieces_score += 0.1
-                        if square.piece.row == 4 and square.piece.pos == 3 or \
-                                square.piece.row == 5 and square.piece.pos == 2:
-                            player_pieces_score += 0.05
-
-                        if square.piece.king is True:
-                            player_pieces_score += 3
-                        else:
-                            player_pieces_score += 1
-                            # Check for the back row pieces
-                            if square.piece.row == 8 and square.piece.pos in [2, 4]:
-                                player_pieces_score += 0.5
-
-        # todo How to implement endgame strategy?
-        # Provide incentive to move towards opponent's pieces if computer is winning?
-        # And stay near safe corners if losing
-        # Advance regular pieces to get more kings if winning
-        # Add condition end_piece_moves satisfied if there are few pieces and a normal piece moved
-        # fixme Problem that computer will sacrifice pieces to try to prevent king?
-
-        score = player_pieces_score - computer_pieces_score
-        return score
-
-    # todo improve dynamic search depth adjustments, using timer?
-    # Dynamically adjust the search depth depending on how complex the board position is
-    new_search_depth = 6
-    if not capturing:  # If there are force jumps, the complexity would appear artificially low
-        moves_count = len(moves)
-        if moves_count == 4:
-            new_search_depth = 7
-        elif moves_count == 3:
-            new_search_depth = 9
-        elif moves_count == 2:
-            new_search_depth = 12
-        elif moves_count == 1:
-            new_search_depth = 20
-
-    # If it's the computer's turn
-    if turn is not player_color:
-        min_value = None
-        for move in moves:
-            # See if this move will move a piece to the end-zone, to decide if this branch must be continued
-            new_end_piece_moved = False
-            # If the piece is from the side at the top of the board
-            if move[0].piece.color is not player_color:
-                if move[0].piece.king is False:
-                    if move[1].row in [6, 7]:
-                        new_end_piece_moved = True
-            # If the piece is from the side at the bottom of the board
-            if move[0].piece.color is player_color:
-                if move[0].piece.king is False:
-                    if move[1].row in [2, 3]:
-                        new_end_piece_moved = True
-
-            new_virtual_squares = duplicate(board)
-            move_piece(move[0], move[1], move[2], new_virtual_squares, player_color)
-            new_value = minimax(new_virtual_squares, not turn, depth + 1, new_end_piece_moved,
-                                new_search_depth, player_color)
-            if min_value is None:
-                min_value = new_value
-            else:
-                if new_value < min_value:
-                    min_value = new_value
-        return min_value
-
-    # If it's the player's turn
-    if turn is player_color:
-        max_value = None
-        for move in moves:
-            # See if this move will move a piece to the end-zone, to decide if this branch must be continued
-            new_end_piece_moved = False
-            # If the piece is from the side at top of board
-            if move[0].piece.color is not player_color:
-                if move[0].piece.king is False:
-                    if move[1].row in [6, 7]:
-                        new_end_piece_moved = True
-            # If the piece is from the side at bottom of board
-            if move[0].piece.color is player_color:
-                if move[0].piece.king is False:
-                    if move[1].row in [2, 3]:
-                        new_end_piece_moved = True
-
-            new_virtual_squares = duplicate(board)
-            move_piece(move[0], move[1], move[2], new_virtual_squares, player_color)
-            new_value = minimax(new_virtual_squares, not turn, depth + 1, new_end_piece_moved,
-                                new_search_depth, player_color)
-            if max_value is None:
-                max_value = new_value
-            else:
-                if new_value > max_value:
-                    max_value = new_value
-        return max_value
+def move_text(move, score):
+    """A move and its score, as shown in the debug menu"""
+    start_row, start_pos = engine.square_row_pos(move.start)
+    end_row, end_pos = engine.square_row_pos(move.end)
+    if score > 100_000:
+        return f"{start_row} {start_pos} to {end_row} {end_pos} : Player win"
+    if score < -100_000:
+        return f"{start_row} {start_pos} to {end_row} {end_pos} : Computer win"
+    return f"{start_row} {start_pos} to {end_row} {end_pos} : {score:.2f}"
+
+
+class DebugPanel:
+    def __init__(self, game_board, top=60, spacing=15):
+        """The lines of text in the debug menu, showing the computer's moves and their scores
+        game_board: The game board (gr.GraphWin) the menu is on
+        top: y coordinate of the first line, spacing: Distance between lines
+        texts: The gr.Text items of the lines, made and drawn the first time they're needed and then kept, only their
+        text is changed after that (blank for lines that aren't being used)
+        """
 
+        self.game_board = game_board
+        self.top = top
+        self.spacing = spacing
+        self.texts = []
+
+    def show(self, lines):
+        """Changes the menu to show a list of lines, only the text items whose line changed are touched"""
+        while len(self.texts) < len(lines):
+            text = gr.Text(gr.Point(610, self.top + len(self.texts) * self.spacing), "")
+            text.setSize(10)
+            text.draw(self.game_board)
+            self.texts.append(text)
+        for num, text in enumerate(self.texts):
+            line = lines[num] if num < len(lines) else ""
+            if text.getText() != line:
+                text.setText(line)
+
+
+def think(position, time_budget, pool, game_board, debug_panel):
+    """Searches for the computer's move in the background, so the window keeps responding and can show how the search
+    is going, until time_budget runs out or STOP_KEY is pressed, returns the engine.SearchResult
+    The scores of the moves are shown in debug_panel (DebugPanel) as each of them is searched
+    """
+    progress = engine.SearchProgress(position)
+    # Throw away keys pressed before the search started, so they don't stop it
+    game_board.checkKey()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        search = executor.submit(engine.best_move, position, engine.Limits(time_budget), pool,
+                                 progress=progress.update)
+        stopping = False
+        while not search.done():
+            if game_board.checkKey() == STOP_KEY:
+                stopping = True
+            if stopping:
+                # Asked again until it's done, in case the search hadn't got going yet the first time
+                # (a new search clears the stop request when it starts)
+                pool.stop()
+            lines = [f"Thinking... ({STOP_KEY} to stop)", f"Depth {progress.depth}, {progress.nodes} nodes"]
+            best = progress.best()
+            if best is not None:
+                lines.append(f"Best: {move_text(*best)}")
+            lines.append("")
+            for move, move_score in zip(progress.moves, progress.move_scores):
+                if move_score is not None:
+                    depth, score = move_score
+                    lines.append(f"{move_text(move, score)} ({depth})")
+            debug_panel.show(lines)
+            # Handle the window's events, at most 30 times a second
+            gr.update(30)
+    return search.result()
+
+
+class Ponder:
+    def __init__(self, position, pv, pool):
+        """Keeps the computer searching while it waits for the player to move (pondering)
+        position: engine.Position with the player to move
+        pv: The moves the computer expects from here [(start, end), ...], see engine.SearchResult, the position after
+        the first one (the player's expected reply) is searched
+        If it's empty (after a book move), the reply the book weights highest is expected instead, or failing that, the
+        best move a quick search finds
+        pool: engine.SearchPool that does the searching
+        Even if the player makes a different move, the search fills the transposition table the workers share,
+        and parts of it come up again when the computer searches the position that's actually reached
+        """
 
-def computer_move(squares, player_color, moves_display, game_board):
-    """Computer makes a move"""
+        self.pool = pool
+        self.start_time = time.time()
+        moves = engine.legal_moves(position)
+        expected = None
+        if pv:
+            expected = next((move for move in moves if (move.start, move.end) == tuple(pv[0])), None)
+        if expected is None:
+            found = engine.default_book().lookup(position)
+            if found:
+                expected = max(found, key=lambda entry: entry[1])[0]
+        if expected is None and moves:
+            expected = engine.best_move(position, engine.Limits(None, PONDER_GUESS_DEPTH, use_book=False), pool).move
+
+        # If the player can't move, the game is over and there's nothing to ponder
+        self.position = None
+        self.search = None
+        if expected is None:
+            return
+        self.position = engine.apply(position, expected)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        # No time limit, it searches until finish() is called
+        self.search = self.executor.submit(engine.best_move, self.position, engine.Limits(None), pool)
+
+    def finish(self, position=None):
+        """Stops pondering, returns (engine.SearchResult, seconds spent) if the position searched is the one given,
+        (None, seconds spent) if it isn't
+        """
+        if self.search is None:
+            return None, time.time() - self.start_time
+        while not self.search.done():
+            # Asked again until it's done, in case the search hadn't got going yet the first time
+            self.pool.stop()
+            concurrent.futures.wait([self.search], timeout=0.1)
+        self.executor.shutdown()
+        ponder_time = time.time() - self.start_time
+        if position is None or position.pack() != self.position.pack():
+            return None, ponder_time
+        return self.search.result(), ponder_time
+
+
+def computer_move(squares, player_color, debug_panel, game_board, pool, time_budget=engine.TIME_BUDGET,
+                  ponder=None):
+    """Computer makes a move, thinking for about time_budget seconds, or until STOP_KEY is pressed
+    debug_panel: DebugPanel that the moves and their scores are shown in
+    pool: engine.SearchPool whose worker processes do the searching
+    ponder: Ponder that has been searching while the player moved, if its guess was right, its search is used
+    Returns the engine.SearchResult of the move
+    """
     # The computer uses the minimax algorithm to decide how to move next
     # Basically, the algorithm makes a tree with all possible future moves as deep as possible, limited by
     # processing power and memory
@@ -782,82 +553,54 @@ def computer_move(squares, player_color, moves_display, game_board):
     # Then the computer makes the move with the maximum score
     # Now let's implement this in code:
 
-    # These are all the possible moves that the computer must look at:
-    # moves = [[start_square, end_square, [captured, ...]], ...]
-    moves = find_moves(squares, not player_color, player_color)
-
-    # todo make only evaluate if more than 1 move possible
-
-    moves_scored = []  # Holds a score for how good a move is
-    # Initialize moves_scored
-    # moves_scored = [[[start_square, end_square, [captured, ...]], score], ...]
-    for move in moves:
-        moves_scored.append([move, None])
-
-    with concurrent.futures.ProcessPoolExecutor() as executor:
-        processes = []
-        for move in moves_scored:
-            new_virtual_squares = duplicate(squares)
-            move_piece(move[0][0], move[0][1], move[0][2], new_virtual_squares, player_color)
-            process = executor.submit(minimax, new_virtual_squares, player_color, 1, False, 6, player_color)
-            processes.append(process)
-        for num, move in enumerate(moves_scored):
-            move[1] = processes[num].result()
-
-    # todo Refactor code? Fix variable shadowing?
-
-    # Round numbers to 2 decimal places to get rid of binary rounding error
-    for move in moves_scored:
-        move[1] = round(move[1], 2)
-
-    # Pick out the move(s) with the lowest score in moves_scored (meaning worst for player, best for computer),
-    # and pick random move from the move(s)
-    lowest = None
-    best_moves = []
-    for i, move in enumerate(moves_scored):
-        if lowest is None:
-            lowest = moves_scored[i][1]
-            best_moves.append(move)
-        else:
-            if moves_scored[i][1] == lowest:
-                best_moves.append(move)
-            elif moves_scored[i][1] < lowest:
-                lowest = moves_scored[i][1]
-                best_moves.clear()
-                best_moves.append(move)
-
-    move_chosen = best_moves[random.randrange(0, len(best_moves))]
-    start_square = move_chosen[0][0]
-    end_square = move_chosen[0][1]
-    captured = move_chosen[0][2]
+    # The search itself is done by the engine, see engine.best_move()
+    # moves_scored = [[engine.Move, score], ...]
+    position = squares_to_position(squares, not player_color, player_color)
+
+    result = None
+    if ponder is not None:
+        pondered, ponder_time = ponder.finish(position)
+        if pondered is not None:
+            # The player made the move the computer expected, so it has already been thinking about this position
+            if ponder_time >= time_budget:
+                result = pondered
+            else:
+                # Search for the rest of the time, most of the work is already in the transposition table
+                time_budget -= ponder_time
+    if result is None:
+        result = think(position, time_budget, pool, game_board, debug_panel)
+    moves_scored = result.moves_scored
 
-    move_piece(start_square, end_square, captured, squares, player_color)
+    engine.move_piece(position, result.move, player_color)
+    position_to_squares(position, squares)
 
     # Display moves_scored
-    for move in moves_display:
-        if move is not None:
-            move.undraw()
-
-    moves_display.clear()
-    line = 60
-    for move in moves_scored:
-        score = move[1]
-        if score > 100_000:
-            text = gr.Text(gr.Point(575, line), f"{move[0][0].row} {move[0][0].pos} to "
-                                                f"{move[0][1].row} {move[0][1].pos} : Player win")
-        elif score < -100_000:
-            text = gr.Text(gr.Point(575, line), f"{move[0][0].row} {move[0][0].pos} to "
-                                                f"{move[0][1].row} {move[0][1].pos} : Computer win")
-        else:
-            text = gr.Text(gr.Point(575, line), f"{move[0][0].row} {move[0][0].pos} to "
-                                                f"{move[0][1].row} {move[0][1].pos} : {score:.2f}")
-        text.setSize(10)
-        moves_display.append(text)
-        line += 15
-    for move in moves_display:
-        move.draw(game_board)
-
-    return True
+    lines = []
+    if result.book:
+        # Nothing was searched, the move came straight from the opening book
+        start_row, start_pos = engine.square_row_pos(result.move.start)
+        end_row, end_pos = engine.square_row_pos(result.move.end)
+        lines.append(f"{start_row} {start_pos} to {end_row} {end_pos} : Book")
+    # With how much searching each move took, so a move that took far more than the rest stands out
+    # (moves_scored is empty for a book move)
+    for num, (move, score) in enumerate(moves_scored):
+        lines.append(f"{move_text(move, score)} ({result.stats['move_nodes'][num]} nodes, "
+                     f"{result.stats['move_times'][num]:.2f} s)")
+    if not result.book:
+        # How the search went
+        stats = result.stats
+        branching_factor = "?" if stats["branching_factor"] is None else f"{stats['branching_factor']:.2f}"
+        table_hit_rate = "?" if stats["table_hit_rate"] is None else f"{stats['table_hit_rate']:.0%}"
+        lines += ["",
+                  f"Depth {result.depth} ({stats['max_depth']} max)",
+                  f"{result.nodes} nodes, {result.search_time:.2f} s",
+                  f"Branching factor {branching_factor}",
+                  f"TT hits {table_hit_rate}",
+                  f"{stats['evaluations']} evaluations",
+                  f"{stats['quiescence_limit']} quiescence cut short"]
+    debug_panel.show(lines)
+
+    return result
 
 
 def main():
@@ -882,7 +625,7 @@ def main():
     color_selector.close()
 
     # The game board
-    game_board = gr.GraphWin("Checkers AI", 650, 500, autoflush=False)  # todo switch graphics to pygame
+    game_board = gr.GraphWin("Checkers AI", 760, 500, autoflush=False)  # todo switch graphics to pygame
 
     # Initialize game
     squares = [[],
@@ -896,10 +639,15 @@ def main():
 
     initialize_board(player_color, squares, game_board)
 
-    # Holds the moves displayed on the debug menu
-    moves_display = []
+    # Shows the computer's moves and their scores on the debug menu
+    debug_panel = DebugPanel(game_board)
+
+    # The computer's worker processes are started once and kept for the whole game
+    pool = engine.SearchPool(engine.WORKERS)
 
     player_won, computer_won = False, False
+    # Searches in the background while it's the player's turn
+    ponder = None
 
     # Black moves first
     turn = True
@@ -914,26 +662,14 @@ def main():
                         square.piece.highlight = False
 
         # Update the drawing of everything in between mouse clicks
-        for row in squares:
-            for square in row:
-                square.draw_square()
-                if square.piece is not None:
-                    square.piece.draw_piece()
-        game_board.update()
+        redraw(squares, game_board)
+
+        position = squares_to_position(squares, turn, player_color)
 
         # If it's the player's turn
         if turn is player_color:
             # Check if the player is able to move
-            able = False
-            for row in squares:
-                for square in row:
-                    if square.piece is not None:
-                        if square.piece.color is player_color:
-                            if search(square, squares, player_color) != {}:
-                                able = True
-                                break
-
-            if able is False:
+            if not engine.has_any_move(position, player_color, player_color):
                 computer_won = True
                 break
 
@@ -942,26 +678,24 @@ def main():
         # If it's the computer's turn
         else:
             # Check if the computer is able to move
-            able = False
-            for row in squares:
-                for square in row:
-                    if square.piece is not None:
-                        if square.piece.color is not player_color:
-                            if search(square, squares, player_color) != {}:
-                                able = True
-                                break
-
-            if able is False:
+            if not engine.has_any_move(position, not player_color, player_color):
                 player_won = True
                 break
 
-            moved = computer_move(squares, player_color, moves_display, game_board)
+            result = computer_move(squares, player_color, debug_panel, game_board, pool, ponder=ponder)
+            # Think about the player's move while they do
+            ponder = Ponder(squares_to_position(squares, player_color, player_color), result.pv, pool)
+            moved = True
 
         # Only flip whose turn it is if the player actually made a move
         if moved:
             # Flip whose turn it is
             turn = not turn
 
+    if ponder is not None:
+        ponder.finish()
+    pool.shutdown()
+
     if player_won:
         player_won_text = gr.Text(gr.Point(250, 25), "Player Won")
         player_won_text.setSize(16)
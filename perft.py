@@ -0,0 +1,72 @@
+import argparse
+import sys
+import time
+
+import engine
+
+# Known perft counts from the starting position, used to check the move generator
+KNOWN_PERFT = {
+    1: 7,
+    2: 49,
+    3: 302,
+    4: 1469,
+    5: 7361,
+    6: 36768,
+    7: 179740,
+    8: 845931,
+}
+
+
+def move_text(move):
+    """A move as "row pos to row pos", with the captured squares after it"""
+    start_row, start_pos = engine.square_row_pos(move.start)
+    end_row, end_pos = engine.square_row_pos(move.end)
+    text = f"{start_row} {start_pos} to {end_row} {end_pos}"
+    if move.captured:
+        text += " capturing " + ", ".join("{} {}".format(*engine.square_row_pos(square))
+                                          for square in engine.mask_squares(move.captured))
+    return text
+
+
+def divide(position, depth):
+    """Perft count split up by the first move: [[move, count], ...]"""
+    counts = []
+    for move in engine.legal_moves(position):
+        counts.append([move, engine.perft(engine.apply(position, move), depth - 1)])
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Counts the positions reached from the start after a number of "
+                                                 "plies, and checks the counts against the known ones")
+    parser.add_argument("depth", type=int, help="number of plies")
+    parser.add_argument("--divide", action="store_true", help="show the count for each first move")
+    args = parser.parse_args()
+
+    position = engine.new_game()
+    failed = False
+    for depth in range(1, args.depth + 1):
+        start = time.perf_counter()
+        if args.divide and depth == args.depth:
+            counts = divide(position, depth)
+            for move, count in counts:
+                print(f"  {move_text(move)}: {count}")
+            total = sum(count for _, count in counts)
+        else:
+            total = engine.perft(position, depth)
+        elapsed = time.perf_counter() - start
+
+        if depth not in KNOWN_PERFT:
+            status = "unknown"
+        elif total == KNOWN_PERFT[depth]:
+            status = "ok"
+        else:
+            status = f"WRONG, should be {KNOWN_PERFT[depth]}"
+            failed = True
+        print(f"perft({depth}) = {total} in {elapsed:.2f} s: {status}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import argparse
+import concurrent.futures
+import json
+import os
+import random
+import time
+
+import engine
+
+# A game is a draw once this many plies in a row have gone by without a capture or a normal piece moving
+NO_PROGRESS_PLIES = 80
+# Stop games that go on for too long anyway, and count them as draws
+MAX_GAME_PLIES = 400
+# Smaller than the GUI's table, since every worker process has its own tables for both configs
+SELF_PLAY_TT_SIZE_MB = 16
+
+# Transposition tables of this worker process, one per config (the scores stored depend on the weights)
+_tables = {}
+
+
+class Config:
+    def __init__(self, name, time_budget, max_depth, weights_file):
+        """One of the two engine setups that play against each other
+        name: "a" or "b", used in the results
+        time_budget, max_depth: See engine.Limits
+        weights_file: Weights file to evaluate with (see engine.load_weights()), engine.WEIGHTS_FILE if not given
+        weights: The weight table read from it
+        """
+
+        self.name = name
+        self.time_budget = time_budget
+        self.max_depth = max_depth
+        self.weights_file = weights_file
+        self.weights = engine.load_weights(weights_file) if weights_file is not None else engine.DEFAULT_TABLE
+
+    def limits(self):
+        # No opening book, both configs would play the same book moves, which hides the difference between them
+        return engine.Limits(self.time_budget, self.max_depth, self.weights, use_book=False)
+
+
+def play_game(game_number, opening_seed, config_black, config_red, random_plies):
+    """Plays one game between two configs, returns a dict describing how it went
+    opening_seed: Seed for the random opening moves, games with the same seed start the same way
+    config_black: Config that plays black (moves first), config_red: Config that plays red
+    random_plies: Number of random moves played at the start, before the configs take over
+    """
+    opening_random = random.Random(opening_seed)
+    # The engine picks randomly between equally good moves, so seed that too to be able to replay a game
+    random.seed(opening_seed * 2 + game_number % 2)
+
+    position = engine.new_game()
+    stats = {config.name: {"moves": 0, "time": 0.0, "nodes": 0} for config in (config_black, config_red)}
+    plies = 0
+    no_progress = 0
+    winner = None
+    # Every move of the game as [start, end, captured mask], so it can be replayed (book.py builds an opening
+    # book out of them)
+    game_moves = []
+    while True:
+        moves = engine.legal_moves(position)
+        if not moves:
+            # The side to move has no moves left, so it loses
+            winner = config_red if position.turn is True else config_black
+            break
+        if no_progress >= NO_PROGRESS_PLIES or plies >= MAX_GAME_PLIES:
+            break
+
+        if plies < random_plies:
+            move = moves[opening_random.randrange(0, len(moves))]
+        else:
+            config = config_black if position.turn is True else config_red
+            if config.name not in _tables:
+                _tables[config.name] = engine.TranspositionTable(SELF_PLAY_TT_SIZE_MB)
+            result = engine.best_move(position, config.limits(), table=_tables[config.name])
+            move = result.move
+            config_stats = stats[config.name]
+            config_stats["moves"] += 1
+            config_stats["time"] += result.search_time
+            config_stats["nodes"] += result.nodes
+
+        if move.captured or not position.kings & 1 << move.start:
+            no_progress = 0
+        else:
+            no_progress += 1
+        position = engine.apply(position, move)
+        game_moves.append([move.start, move.end, move.captured])
+        plies += 1
+
+    return {
+        "game": game_number,
+        "black": config_black.name,
+        "red": config_red.name,
+        "winner": winner.name if winner is not None else None,
+        "plies": plies,
+        "moves": game_moves,
+        "stats": stats,
+    }
+
+
+def run(games, config_a, config_b, random_plies, workers=None, seed=None):
+    """Plays a batch of games across a process pool, returns the summary that's written to the results file
+    Games are played in pairs from the same opening, with the configs swapping colors
+    """
+    if seed is None:
+        seed = random.randrange(0, 2 ** 32)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    batch_start = time.time()
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        processes = []
+        for game_number in range(games):
+            opening_seed = seed + game_number // 2
+            if game_number % 2 == 0:
+                config_black, config_red = config_a, config_b
+            else:
+                config_black, config_red = config_b, config_a
+            processes.append(executor.submit(play_game, game_number, opening_seed, config_black, config_red,
+                                             random_plies))
+        for process in concurrent.futures.as_completed(processes):
+            results.append(process.result())
+            print(f"\r{len(results)}/{games} games played", end="", flush=True)
+    print()
+    results.sort(key=lambda game: game["game"])
+
+    summary = {
+        "games": games,
+        "random_plies": random_plies,
+        "seed": seed,
+        "workers": workers,
+        "wall_time": round(time.time() - batch_start, 2),
+        "configs": {},
+        "results": results,
+    }
+    for config, opponent in ((config_a, config_b), (config_b, config_a)):
+        moves = sum(game["stats"][config.name]["moves"] for game in results)
+        search_time = sum(game["stats"][config.name]["time"] for game in results)
+        nodes = sum(game["stats"][config.name]["nodes"] for game in results)
+        summary["configs"][config.name] = {
+            "time_budget": config.time_budget,
+            "max_depth": config.max_depth,
+            "weights_file": config.weights_file,
+            "wins": sum(game["winner"] == config.name for game in results),
+            "draws": sum(game["winner"] is None for game in results),
+            "losses": sum(game["winner"] == opponent.name for game in results),
+            "average_move_time": round(search_time / moves, 4) if moves else None,
+            "nodes_per_second": round(nodes / search_time) if search_time else None,
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plays the computer against itself with two engine configs")
+    parser.add_argument("--games", type=int, default=100, help="number of games to play")
+    parser.add_argument("--depth-a", type=int, default=engine.MAX_SEARCH_DEPTH, help="max depth of config a")
+    parser.add_argument("--depth-b", type=int, default=engine.MAX_SEARCH_DEPTH, help="max depth of config b")
+    parser.add_argument("--time-a", type=float, default=0.1, help="seconds per move for config a, 0 for no limit")
+    parser.add_argument("--time-b", type=float, default=0.1, help="seconds per move for config b, 0 for no limit")
+    parser.add_argument("--weights-a", help="JSON file with evaluation weights for config a")
+    parser.add_argument("--weights-b", help="JSON file with evaluation weights for config b")
+    parser.add_argument("--random-plies", type=int, default=4, help="random moves at the start of each game")
+    parser.add_argument("--workers", type=int, help="worker processes, one per core if not given")
+    parser.add_argument("--seed", type=int, help="seed for the openings, random if not given")
+    parser.add_argument("--output", default="selfplay_results.json", help="where to write the results")
+    args = parser.parse_args()
+
+    config_a = Config("a", args.time_a or None, args.depth_a, args.weights_a)
+    config_b = Config("b", args.time_b or None, args.depth_b, args.weights_b)
+    summary = run(args.games, config_a, config_b, args.random_plies, args.workers, args.seed)
+    with open(args.output, "w") as file:
+        json.dump(summary, file, indent=2)
+
+    for name, config_summary in summary["configs"].items():
+        print(f"{name}: {config_summary['wins']} W / {config_summary['draws']} D / {config_summary['losses']} L, "
+              f"{config_summary['average_move_time']} s per move, {config_summary['nodes_per_second']} nodes/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+import argparse
+import array
+import os
+import time
+
+import engine
+
+
+def signatures(max_pieces):
+    """All the signatures (own men, own kings, opponent men, opponent kings) with up to max_pieces pieces,
+    in the order they need to be generated: moves from a signature only lead to the same signature seen from the
+    other side, signatures with fewer pieces (captures) or signatures with fewer men (promotions)
+    """
+    found = []
+    for total in range(2, max_pieces + 1):
+        for own in range(1, total):
+            for own_men in range(own + 1):
+                for opponent_men in range(total - own + 1):
+                    found.append((own_men, own - own_men, opponent_men, total - own - opponent_men))
+    found.sort(key=lambda signature: (sum(signature), signature[0] + signature[2]))
+    return found
+
+
+def unrank(signature, index):
+    """Turns an index in the file of a signature back into the groups of pieces, the reverse of
+    engine.tablebase_index()
+    """
+    ranks = []
+    free = 32 - sum(signature)
+    for count in reversed(signature):
+        free += count
+        ranks.append(index % engine.BINOMIAL[free][count])
+        index //= engine.BINOMIAL[free][count]
+    ranks.reverse()
+
+    groups = []
+    occupied = 0
+    for count, rank in zip(signature, ranks):
+        if not count:
+            groups.append(0)
+            continue
+        # Squares that are still free, the rank numbers the combination among them
+        free_squares = [square for square in range(32) if not occupied & 1 << square]
+        group = 0
+        for num in range(count, 0, -1):
+            compressed = num - 1
+            while engine.BINOMIAL[compressed + 1][num] <= rank:
+                compressed += 1
+            rank -= engine.BINOMIAL[compressed][num]
+            group |= 1 << free_squares[compressed]
+        groups.append(group)
+        occupied |= group
+    return groups
+
+
+def value_to_byte(result, distance):
+    """How a result is stored in the file: 0 draw, 1 to 127 win in that many plies, 128 + n loss in n plies
+    Longer distances are stored as 127, the result is still right, the computer just can't tell how long it takes
+    """
+    distance = min(distance, 127)
+    if result == "win":
+        return distance
+    return 128 + distance
+
+
+def node_position(signature, index):
+    """The position at an index in the file of a signature, with the side whose turn it is playing black from the
+    bottom of the board, None if it can't happen (men on the row where they would have become kings)
+    """
+    own_men, own_kings, opponent_men, opponent_kings = unrank(signature, index)
+    if own_men & 0xf or opponent_men & 0xf0000000:
+        return None
+    return engine.Position(red=opponent_men | opponent_kings, black=own_men | own_kings,
+                           kings=own_kings | opponent_kings, turn=True, player_color=True)
+
+
+def parents(position, offsets):
+    """The positions one move before a position (from node_position()) that are in the signatures being generated,
+    yields their nodes
+    Only moves that don't capture or promote stay in the same signatures, so it's enough to step each of the
+    opponent's pieces back to an empty square next to it, and keep the ones where that step is a possible move
+    """
+    occupied = position.red | position.black
+    # Only which pieces are where matters here, so one Position is reused, without keeping its hash and score right
+    parent = position.copy()
+    parent.turn = False
+    for end in range(32):
+        if not position.red & 1 << end:
+            continue
+        king = position.kings & 1 << end
+        for connection_type in range(4):
+            start = engine.NEIGHBOURS[end * 4 + connection_type]
+            # The opponent's men move towards the bottom of the board, to higher square indexes
+            if start is None or occupied & 1 << start or not king and start > end:
+                continue
+            parent.red = position.red ^ 1 << end ^ 1 << start
+            parent.kings = position.kings ^ (1 << end ^ 1 << start if king else 0)
+            # A normal move is only possible if there's nothing to capture
+            if engine.has_capture(parent, False, True):
+                continue
+            groups = engine.tablebase_groups(parent)
+            signature = tuple(group.bit_count() for group in groups)
+            yield offsets[signature] + engine.tablebase_index(groups)
+
+
+def generate(pair, solved):
+    """Works out every position of one or two signatures that lead to each other (a signature and the same one
+    seen from the other side), by retrograde analysis: starting from the positions that are lost right away,
+    going backwards one ply at a time
+    solved: {signature: bytes} of all the signatures the moves can lead to
+    Returns {signature: bytearray}
+    """
+    offsets = {}
+    total = 0
+    for signature in pair:
+        offsets[signature] = total
+        total += engine.tablebase_size(signature)
+
+    def node_signature(node):
+        """The signature a node belongs to, and its index in that signature's file"""
+        for signature in reversed(pair):
+            if node >= offsets[signature]:
+                return signature, node - offsets[signature]
+
+    # One flat entry per position, lists of Python objects take far too much memory with 5 or more pieces:
+    # how many of its moves aren't known to lead to a win for the opponent yet (never more than 255 with this few
+    # pieces), and the longest of those wins
+    remaining = bytearray(total)
+    longest_win = array.array("H", bytes(2 * total))
+    # buckets[distance] = array of node * 2 + 1 for a win, node * 2 for a loss, to decide in order of distance
+    buckets = {}
+    results = bytearray(total)
+    decided = bytearray(total)
+    # Positions with a move that's known to win, they can't be lost however their other moves turn out
+    winning = bytearray(total)
+
+    def push(node, result, distance):
+        if result == "win":
+            winning[node] = True
+        buckets.setdefault(distance, array.array("Q")).append(node * 2 + (result == "win"))
+
+    for node in range(total):
+        position = node_position(*node_signature(node))
+        if position is None:
+            decided[node] = True
+            continue
+
+        moves = engine.find_moves(position, True, True)
+        if not moves:
+            push(node, "loss", 0)
+            continue
+
+        shortest_win = None
+        for move in moves:
+            undo = engine.move_piece(position, move, True)
+            child_groups = engine.tablebase_groups(position)
+            engine.unmake_move(position, undo)
+
+            child_signature = tuple(group.bit_count() for group in child_groups)
+            if child_signature[0] + child_signature[1] == 0:
+                # The opponent has no pieces left, so has lost
+                shortest_win = 1
+                continue
+            if child_signature in offsets:
+                # Worked out below, parents() finds this move again from the other end
+                remaining[node] += 1
+                continue
+
+            value = solved[child_signature][engine.tablebase_index(child_groups)]
+            if value == 0:
+                # Leads to a draw, so this position can't be lost, count it as never decided
+                remaining[node] += 1
+            elif value < 128:
+                longest_win[node] = max(longest_win[node], value)
+            elif shortest_win is None or value - 128 + 1 < shortest_win:
+                shortest_win = value - 128 + 1
+
+        if shortest_win is not None:
+            push(node, "win", shortest_win)
+        elif remaining[node] == 0:
+            # Every move leads to a position that's already known to be won by the opponent
+            push(node, "loss", longest_win[node] + 1)
+
+    distance = 0
+    while buckets:
+        for entry in buckets.pop(distance, ()):
+            node = entry >> 1
+            result = "win" if entry & 1 else "loss"
+            if decided[node]:
+                continue
+            decided[node] = True
+            results[node] = value_to_byte(result, distance)
+            for parent in parents(node_position(*node_signature(node)), offsets):
+                if decided[parent]:
+                    continue
+                if result == "loss":
+                    push(parent, "win", distance + 1)
+                else:
+                    remaining[parent] -= 1
+                    longest_win[parent] = max(longest_win[parent], distance)
+                    if remaining[parent] == 0 and not winning[parent]:
+                        push(parent, "loss", longest_win[parent] + 1)
+        distance += 1
+
+    # Positions that never got decided are draws, which is already what 0 means
+    tables = {}
+    for signature in pair:
+        offset = offsets[signature]
+        tables[signature] = results[offset:offset + engine.tablebase_size(signature)]
+    return tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates the endgame tablebase files the computer looks up")
+    parser.add_argument("--pieces", type=int, default=4,
+                        help="most pieces on the board (each extra piece takes a lot longer and more memory)")
+    parser.add_argument("--directory", default=engine.TABLEBASE_DIR, help="where to write the files")
+    args = parser.parse_args()
+
+    os.makedirs(args.directory, exist_ok=True)
+    solved = {}
+    done = set()
+    for signature in signatures(args.pieces):
+        if signature in done:
+            continue
+        mirrored = signature[2:] + signature[:2]
+        pair = [signature] if mirrored == signature else [signature, mirrored]
+        done.update(pair)
+
+        paths = [engine.tablebase_file(args.directory, member) for member in pair]
+        if all(os.path.exists(path) for path in paths):
+            # Already generated before
+            for member, path in zip(pair, paths):
+                with open(path, "rb") as file:
+                    solved[member] = file.read()
+            continue
+
+        start = time.time()
+        tables = generate(pair, solved)
+        for member, path in zip(pair, paths):
+            with open(path, "wb") as file:
+                file.write(tables[member])
+            solved[member] = bytes(tables[member])
+        print(f"{', '.join(''.join(map(str, member)) for member in pair)}: "
+              f"{sum(len(table) for table in tables.values())} positions in {time.time() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()